@@ -1,80 +1,174 @@
 import json
 import os
+import sqlite3
+import threading
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
+def _dumps(obj) -> str:
+    """Serialize command details compactly, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(',', ':'))
+
+def _loads(text):
+    """Parse JSON text or bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+WAL_SIZE_LIMIT = 1024 * 1024  # Bytes the WAL is truncated back to after a checkpoint
+
 class CommandDB:
-    def __init__(self, db_file: str = "commands.json"):
-        """Initialize the command database using JSON file storage."""
+    def __init__(self, db_file: str = "commands.db", legacy_json_file: str = "commands.json"):
+        """Initialize the command database using SQLite storage in WAL mode."""
         # Get the absolute path to the server directory
         server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.db_file = os.path.join(server_dir, db_file)
+        # The connection is shared between the FastAPI handlers and worker threads
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # Cached last_command row and the data_version it was read at
+        self._last_command = None
+        self._last_command_version = None
         self._init_db()
-        log.info(f"Command database initialized using JSON file: {self.db_file}")
+        self._import_legacy_json(os.path.join(server_dir, legacy_json_file))
+        log.info(f"Command database initialized using SQLite file: {self.db_file}")
 
     def _init_db(self):
-        """Initialize the JSON database file if it doesn't exist."""
+        """Create the tables if they don't exist and configure the journal."""
         try:
-            if not os.path.exists(self.db_file):
-                # Create directory if it doesn't exist
-                os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
-                with open(self.db_file, 'w') as f:
-                    json.dump({
-                        "commands": [],
-                        "last_command": None
-                    }, f, indent=2)
-                log.info(f"Created new command database file: {self.db_file}")
-            else:
-                log.info(f"Using existing command database file: {self.db_file}")
+            with self._lock:
+                # WAL appends commits to the log instead of rewriting the store
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.conn.execute("PRAGMA temp_store=MEMORY")
+                self.conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT}")
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS commands (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        command TEXT,
+                        source TEXT,
+                        type TEXT,
+                        status TEXT,
+                        timestamp TEXT,
+                        last_updated TEXT,
+                        details TEXT
+                    )
+                """)
+                # id is the rowid, so id lookups are already indexed; this partial
+                # index keeps get_pending_commands from scanning the whole history
+                self.conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_commands_pending
+                    ON commands (id) WHERE status = 'pending'
+                """)
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS last_command (
+                        id INTEGER PRIMARY KEY CHECK (id = 0),
+                        cmd_id INT,
+                        command TEXT,
+                        type TEXT,
+                        timestamp TEXT
+                    )
+                """)
+                self.conn.commit()
         except Exception as e:
             log.error(f"Error initializing database file: {e}")
             raise
 
-    def _read_db(self) -> Dict:
-        """Read the entire database from the JSON file."""
+    def _import_legacy_json(self, json_file: str):
+        """Import the command history from the old JSON file into an empty database."""
         try:
-            with open(self.db_file, 'r') as f:
-                return json.load(f)
+            if not os.path.exists(json_file):
+                return
+            with self._lock:
+                if self.conn.execute("SELECT 1 FROM commands LIMIT 1").fetchone():
+                    return
+                with open(json_file, 'rb') as f:
+                    data = _loads(f.read())
+                with self.conn:
+                    # Keep existing IDs; entries saved without one are numbered after them
+                    for cmd in sorted(data.get('commands', []), key=lambda c: c.get('id') is None):
+                        self._insert_command(cmd)
+                    last_command = data.get('last_command')
+                    if last_command:
+                        self._set_last_command(last_command)
+            log.info(f"Imported {len(data.get('commands', []))} commands from {json_file}")
         except Exception as e:
-            log.error(f"Error reading database file: {e}")
-            return {"commands": [], "last_command": None}
+            log.error(f"Error importing legacy JSON database: {e}")
 
-    def _write_db(self, data: Dict):
-        """Write data to the JSON database file."""
-        try:
-            with open(self.db_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except Exception as e:
-            log.error(f"Error writing to database file: {e}")
+    def _insert_command(self, command_data: Dict) -> int:
+        """Insert a command row and return its ID. Must be called inside a transaction."""
+        details = command_data.get('details')
+        cursor = self.conn.execute(
+            """
+            INSERT INTO commands (id, command, source, type, status, timestamp, last_updated, details)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                command_data.get('id'),
+                command_data.get('command'),
+                command_data.get('source'),
+                command_data.get('type'),
+                command_data.get('status'),
+                command_data.get('timestamp'),
+                command_data.get('last_updated'),
+                _dumps(details) if details is not None else None,
+            )
+        )
+        return cursor.lastrowid
+
+    def _set_last_command(self, last_command: Dict):
+        """Replace the singleton last_command row. Must be called inside a transaction."""
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO last_command (id, cmd_id, command, type, timestamp)
+            VALUES (0, ?, ?, ?, ?)
+            """,
+            (
+                last_command.get('id'),
+                last_command.get('command'),
+                last_command.get('type'),
+                last_command.get('timestamp'),
+            )
+        )
+
+    @staticmethod
+    def _row_to_command(row: sqlite3.Row) -> Dict:
+        """Convert a commands row to the dictionary format used by callers."""
+        cmd = {key: row[key] for key in row.keys() if row[key] is not None}
+        if 'details' in cmd:
+            cmd['details'] = _loads(cmd['details'])
+        return cmd
 
     def add_command(self, command_data: Dict) -> Optional[int]:
         """Add a new command to the database and update last command."""
         try:
-            data = self._read_db()
             command_data['timestamp'] = datetime.now().isoformat()
-            
-            # Generate a new ID if not provided
-            if 'id' not in command_data:
-                # Find the highest existing ID and increment it
-                max_id = max([cmd.get('id', 0) for cmd in data['commands']], default=0)
-                command_data['id'] = max_id + 1
-            
-            data['commands'].append(command_data)
-            
-            # Update last command
-            data['last_command'] = {
-                'id': command_data['id'],
-                'command': command_data.get('command'),
-                'type': command_data.get('type'),
-                'timestamp': command_data['timestamp']
-            }
-            
-            self._write_db(data)
+
+            with self._lock, self.conn:
+                command_data['id'] = self._insert_command(command_data)
+
+                # Update last command
+                self._set_last_command(command_data)
+                # Our own commits don't change data_version, so refresh the cache here
+                self._last_command = {
+                    'id': command_data['id'],
+                    'command': command_data.get('command'),
+                    'type': command_data.get('type'),
+                    'timestamp': command_data['timestamp']
+                }
+
             log.info(f"Added new command with ID {command_data['id']}: {command_data}")
             return command_data['id']
         except Exception as e:
@@ -84,29 +178,58 @@ class CommandDB:
     def update_command_status(self, command_id: int, new_status: str, details: Optional[Dict] = None) -> bool:
         """Update the status of a command."""
         try:
-            data = self._read_db()
-            for cmd in data['commands']:
-                if cmd.get('id') == command_id:
-                    cmd['status'] = new_status
-                    cmd['last_updated'] = datetime.now().isoformat()
-                    if details:
-                        cmd['details'] = details
-                    self._write_db(data)
-                    log.info(f"Updated command {command_id} status to {new_status}")
-                    return True
+            with self._lock, self.conn:
+                if details:
+                    cursor = self.conn.execute(
+                        "UPDATE commands SET status = ?, last_updated = ?, details = ? WHERE id = ?",
+                        (new_status, datetime.now().isoformat(), _dumps(details), command_id)
+                    )
+                else:
+                    cursor = self.conn.execute(
+                        "UPDATE commands SET status = ?, last_updated = ? WHERE id = ?",
+                        (new_status, datetime.now().isoformat(), command_id)
+                    )
+            if cursor.rowcount:
+                log.info(f"Updated command {command_id} status to {new_status}")
+                return True
             log.warning(f"Command {command_id} not found for status update")
             return False
         except Exception as e:
             log.error(f"Error updating command status: {e}")
             return False
 
+    def update_command_statuses(self, updates: List[Tuple[int, str, Optional[Dict]]]) -> int:
+        """Apply several (command_id, new_status, details) updates in one transaction."""
+        try:
+            updated = 0
+            # One timestamp for the whole batch, which is committed together
+            last_updated = datetime.now().isoformat()
+            with self._lock, self.conn:
+                for command_id, new_status, details in updates:
+                    if details:
+                        cursor = self.conn.execute(
+                            "UPDATE commands SET status = ?, last_updated = ?, details = ? WHERE id = ?",
+                            (new_status, last_updated, _dumps(details), command_id)
+                        )
+                    else:
+                        cursor = self.conn.execute(
+                            "UPDATE commands SET status = ?, last_updated = ? WHERE id = ?",
+                            (new_status, last_updated, command_id)
+                        )
+                    updated += cursor.rowcount
+            log.info(f"Updated status of {updated}/{len(updates)} commands")
+            return updated
+        except Exception as e:
+            log.error(f"Error updating command statuses: {e}")
+            return 0
+
     def get_command_status(self, command_id: int) -> Optional[str]:
         """Get the status of a command."""
         try:
-            data = self._read_db()
-            for cmd in data['commands']:
-                if cmd.get('id') == command_id:
-                    return cmd.get('status')
+            with self._lock:
+                row = self.conn.execute("SELECT status FROM commands WHERE id = ?", (command_id,)).fetchone()
+            if row:
+                return row['status']
             log.warning(f"Command {command_id} not found")
             return None
         except Exception as e:
@@ -116,8 +239,9 @@ class CommandDB:
     def get_pending_commands(self) -> List[Dict]:
         """Get all pending commands."""
         try:
-            data = self._read_db()
-            pending = [cmd for cmd in data['commands'] if cmd.get('status') == 'pending']
+            with self._lock:
+                rows = self.conn.execute("SELECT * FROM commands WHERE status = 'pending'").fetchall()
+            pending = [self._row_to_command(row) for row in rows]
             log.info(f"Found {len(pending)} pending commands")
             return pending
         except Exception as e:
@@ -127,10 +251,10 @@ class CommandDB:
     def get_command_by_id(self, command_id: int) -> Optional[Dict]:
         """Get a command by its ID."""
         try:
-            data = self._read_db()
-            for cmd in data['commands']:
-                if cmd.get('id') == command_id:
-                    return cmd
+            with self._lock:
+                row = self.conn.execute("SELECT * FROM commands WHERE id = ?", (command_id,)).fetchone()
+            if row:
+                return self._row_to_command(row)
             log.warning(f"Command {command_id} not found")
             return None
         except Exception as e:
@@ -140,11 +264,9 @@ class CommandDB:
     def delete_command(self, command_id: int) -> bool:
         """Delete a command from the database."""
         try:
-            data = self._read_db()
-            initial_length = len(data['commands'])
-            data['commands'] = [cmd for cmd in data['commands'] if cmd.get('id') != command_id]
-            if len(data['commands']) < initial_length:
-                self._write_db(data)
+            with self._lock, self.conn:
+                cursor = self.conn.execute("DELETE FROM commands WHERE id = ?", (command_id,))
+            if cursor.rowcount:
                 log.info(f"Deleted command {command_id}")
                 return True
             log.warning(f"Command {command_id} not found for deletion")
@@ -156,8 +278,17 @@ class CommandDB:
     def get_last_command(self) -> Optional[Dict]:
         """Get the last executed command."""
         try:
-            data = self._read_db()
-            return data.get('last_command')
+            with self._lock:
+                # data_version only changes when another connection commits, so the
+                # cached row is re-read only after a write from another process
+                version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+                if version != self._last_command_version:
+                    row = self.conn.execute(
+                        "SELECT cmd_id AS id, command, type, timestamp FROM last_command WHERE id = 0"
+                    ).fetchone()
+                    self._last_command = dict(row) if row else None
+                    self._last_command_version = version
+                return self._last_command
         except Exception as e:
             log.error(f"Error getting last command: {e}")
             return None
@@ -172,5 +303,31 @@ class CommandDB:
         last_command = self.get_last_command()
         return last_command is not None and last_command.get('type') == 'pingall'
 
-# Create a global instance
-command_db = CommandDB() 
\ No newline at end of file
+    def compact(self) -> bool:
+        """Checkpoint the WAL into the database file and truncate the WAL."""
+        try:
+            with self._lock:
+                busy, _, _ = self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            if busy:
+                log.warning("WAL checkpoint blocked by another connection")
+                return False
+            log.info("Compacted command database WAL")
+            return True
+        except Exception as e:
+            log.error(f"Error compacting database: {e}")
+            return False
+
+    def close(self):
+        """Compact the WAL and close the database connection."""
+        try:
+            self.compact()
+            with self._lock:
+                self.conn.close()
+            log.info(f"Closed command database: {self.db_file}")
+        except Exception as e:
+            log.error(f"Error closing database: {e}")
+
+@lru_cache(maxsize=1)
+def get_command_db() -> CommandDB:
+    """Return the shared command database, opening it on first use."""
+    return CommandDB()
@@ -1,134 +1,411 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-import os
+from fastapi.responses import ORJSONResponse
+import asyncio
+import orjson
+import operator
+import re
+import logging
+import logging.handlers
+import queue
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from mininet.net import Mininet
 from mininet.node import RemoteController
 from mininet.log import setLogLevel
-from db.command_db import command_db
+from db.command_db import get_command_db
 
 from topologies import StarTopo, RingTopo, CustomTopo, FatTree, PartialMeshTopo, FullMeshTopo, TreeTopo
 import time
-from datetime import datetime
 
-app = FastAPI()
+log = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 network = None  # Store the active Mininet network instance
-connected_clients = []
-last_broadcast_time = {}
-last_data_received = datetime.now()  # Initialize with current time
+nodes_by_name = {}  # Maps host/switch names to nodes of the active network
+topology_data = None  # Hosts, switches and links of the active network
+topology_text = {}  # Formatted dump/net output for the active network
+network_lock = asyncio.Lock()  # Serializes starting and stopping the network
+connected_clients = set()  # Open /ws connections
+unfiltered_clients = set()  # Clients that receive all path data (no subscriptions)
+path_subscribers = {}  # (src, dst) -> clients subscribed to that path's data
+last_broadcast_time = OrderedDict()  # (src, dst) -> monotonic time of its last broadcast
+last_data_received = time.monotonic()  # Monotonic time of the last /path-data POST
 BROADCAST_COOLDOWN = 3.0  # seconds
+MAX_RATE_LIMITED_PATHS = 10000  # Paths remembered by the broadcast rate limiter
+CLIENT_QUEUE_SIZE = 256  # Messages queued per client before it is dropped as too slow
+CLIENT_FLUSH_TIMEOUT = 1.0  # Seconds to wait for queued messages when a client errors out
+PATH_DATA_BATCH_WINDOW = 0.01  # Seconds of path data collected into one broadcast pass
+pending_path_data = []  # ((src, dst), encoded path data) waiting for the next broadcast pass
+path_data_ready = None  # asyncio.Event set when pending_path_data is not empty
+path_data_task = None  # Background task running path_data_broadcaster()
+DB_BATCH_SIZE = 32  # Status updates written per transaction
+DB_BATCH_WINDOW = 0.02  # Seconds to collect status updates before writing them
+db_queue = None  # asyncio.Queue of (command_id, status, details) updates
+DB_WRITER_STOP = None  # Queued at shutdown; db_writer() exits once it has written everything before it
+db_writer_task = None  # Background task running db_writer()
+MININET_CLEANUP_TIMEOUT = 30.0  # Seconds to wait for 'sudo mn -c' before starting anyway
+MININET_WORKERS = 8  # Threads available for blocking Mininet calls
+mininet_executor = ThreadPoolExecutor(max_workers=MININET_WORKERS, thread_name_prefix="mininet")
+PING_SUCCESS = re.compile(r"(?<!\d)0% packet loss")  # Matches 0% loss but not 100% loss
+link_endpoints = operator.attrgetter("intf1.node.name", "intf2.node.name")  # link -> (node1, node2)
+log_listener = None  # QueueListener writing log records from a background thread
+
+@app.on_event("startup")
+async def startup_event():
+    global path_data_ready, path_data_task, db_queue, db_writer_task, log_listener
+    # Handlers only enqueue records; formatting and stream writes happen on the
+    # listener's thread so logging never blocks the event loop
+    log_queue = queue.SimpleQueue()
+    log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(log_queue)])
+    log_listener.start()
+    path_data_ready = asyncio.Event()
+    path_data_task = asyncio.create_task(path_data_broadcaster())
+    db_queue = asyncio.Queue()
+    db_writer_task = asyncio.create_task(db_writer())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if path_data_task:
+        path_data_task.cancel()
+    if db_writer_task:
+        # Let the writer finish its current batch and everything queued before
+        # the sentinel, so no write is still running when the database closes
+        db_queue.put_nowait(DB_WRITER_STOP)
+        try:
+            await db_writer_task
+        except Exception as e:
+            log.error("DB writer failed: %s", e)
+        # Updates queued after the sentinel, or left by a failed writer
+        pending = [update for update in drain_queue(db_queue, db_queue.qsize())
+                   if update is not DB_WRITER_STOP]
+        if pending:
+            get_command_db().update_command_statuses(pending)
+    # Close the command database so the WAL is checkpointed into the main file
+    if get_command_db.cache_info().currsize:
+        get_command_db().close()
+    mininet_executor.shutdown(wait=False)
+    if log_listener:
+        log_listener.stop()
+
+async def run_blocking(func, *args):
+    """Run a blocking Mininet call on the Mininet thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(mininet_executor, func, *args)
+
+def drain_queue(source: asyncio.Queue, limit: int) -> list:
+    """Take up to limit items that are already waiting in a queue."""
+    items = []
+    while len(items) < limit and not source.empty():
+        items.append(source.get_nowait())
+    return items
+
+def queue_status_update(command_id, new_status, details=None):
+    """Queue a command status update for the background DB writer."""
+    db_queue.put_nowait((command_id, new_status, details))
+
+async def db_writer():
+    """Write queued command status updates in batched transactions until DB_WRITER_STOP is read."""
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        batch = [await db_queue.get()]
+        if batch[0] is not DB_WRITER_STOP:
+            await asyncio.sleep(DB_BATCH_WINDOW)
+        batch += drain_queue(db_queue, DB_BATCH_SIZE - 1)
+        updates = [update for update in batch if update is not DB_WRITER_STOP]
+        stopping = len(updates) < len(batch)
+        if updates:
+            await loop.run_in_executor(None, get_command_db().update_command_statuses, updates)
 
 # -------------------- WebSocket Server --------------------
+@dataclass(eq=False)
+class ClientState:
+    """A connected /ws client and the queue its writer task sends from."""
+    websocket: WebSocket
+    out_queue: asyncio.Queue
+    writer: Optional[asyncio.Task] = None
+    # (src, dst) paths whose data the client asked for; None means all paths
+    subscriptions: Optional[Set[Tuple[str, str]]] = None
+
+def drop_client(client: ClientState):
+    """Stop broadcasting to a client and forget its subscriptions."""
+    connected_clients.discard(client)
+    unfiltered_clients.discard(client)
+    for path_key in client.subscriptions or ():
+        subscribers = path_subscribers.get(path_key)
+        if subscribers is not None:
+            subscribers.discard(client)
+            if not subscribers:
+                del path_subscribers[path_key]
+
+async def client_writer(client: ClientState):
+    """Send queued messages to one client, in order, until it disconnects."""
+    while True:
+        payload = await client.out_queue.get()
+        try:
+            await client.websocket.send_text(payload)
+        except Exception as e:
+            log.warning("Error sending to client: %s", e)
+            drop_client(client)
+            return
+        finally:
+            client.out_queue.task_done()
+
+def enqueue(client: ClientState, payload: str) -> bool:
+    """Queue a text frame for a client; returns False if the client is too far behind."""
+    try:
+        client.out_queue.put_nowait(payload)
+        return True
+    except asyncio.QueueFull:
+        return False
+
+async def evict_client(client: ClientState):
+    """Disconnect a client whose outbound queue is full."""
+    log.warning("Client outbound queue full, disconnecting slow client")
+    drop_client(client)
+    client.writer.cancel()
+    try:
+        await client.websocket.close()
+    except Exception as e:
+        # Already closed or half-dead; a failed close must not end the broadcaster
+        log.debug("Error closing slow client: %s", e)
+
+async def release_client(client: ClientState, flush: bool):
+    """Stop a client's writer, optionally letting it send what is already queued."""
+    drop_client(client)
+    if flush:
+        try:
+            await asyncio.wait_for(client.out_queue.join(), CLIENT_FLUSH_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.warning("Timed out flushing messages to client")
+    client.writer.cancel()
+
+async def send_json(client: ClientState, message: dict):
+    """Queue a message for a client as a JSON text frame, encoded with orjson."""
+    if not enqueue(client, orjson.dumps(message).decode()):
+        await evict_client(client)
+
+async def handle_start(client: ClientState, hosts, topology, meshType=""):
+    """Handle start by starting a new Mininet network."""
+    async with network_lock:
+        response = await start_mininet(int(hosts), topology, meshType)
+    await send_json(client, response)
+
+async def handle_stop(client: ClientState):
+    """Handle stop by dropping the active Mininet network."""
+    global network, topology_data
+    async with network_lock:
+        stopped = network is not None
+        network = None
+        topology_data = None
+        topology_text.clear()
+        nodes_by_name.clear()
+    if stopped:
+        await send_json(client, {"message": "Mininet stopped.", "type": "message"})
+    else:
+        await send_json(client, {"message": "No active Mininet session.", "type": "message"})
+
+async def handle_exec(client: ClientState, command):
+    """Handle exec by running the command on the active network."""
+    cmd = command.strip()
+    log.debug("Executing %s...", cmd)
+    result = await execute_mininet_command(cmd)
+    await send_json(client, result)
+
+async def handle_subscribe(client: ClientState, src, dst):
+    """Handle subscribe by limiting the client's path data to the given paths."""
+    path_key = (src, dst)
+    if client.subscriptions is None:
+        client.subscriptions = set()
+        unfiltered_clients.discard(client)
+    client.subscriptions.add(path_key)
+    path_subscribers.setdefault(path_key, set()).add(client)
+    await send_json(client, {"message": f"Subscribed to path data for {src}-{dst}", "type": "message"})
+
+async def handle_unsubscribe(client: ClientState, src, dst):
+    """Handle unsubscribe by no longer sending the client a path's data."""
+    path_key = (src, dst)
+    if client.subscriptions and path_key in client.subscriptions:
+        client.subscriptions.discard(path_key)
+        subscribers = path_subscribers[path_key]
+        subscribers.discard(client)
+        if not subscribers:
+            del path_subscribers[path_key]
+    await send_json(client, {"message": f"Unsubscribed from path data for {src}-{dst}", "type": "message"})
+
+# Command op -> handler, called with the command's arguments as keywords
+COMMAND_HANDLERS = {
+    "start": handle_start,
+    "stop": handle_stop,
+    "exec": handle_exec,
+    "subscribe": handle_subscribe,
+    "unsubscribe": handle_unsubscribe,
+}
+
+def parse_start(payload):
+    """Parse the <hosts>:<topology>:<meshType> part of a start command."""
+    hosts, topology, meshType = payload.split(":")
+    return {"hosts": hosts, "topology": topology, "meshType": meshType}
+
+def parse_path(payload):
+    """Parse the <src>:<dst> part of a subscribe/unsubscribe command."""
+    src, dst = payload.split(":")
+    return {"src": src, "dst": dst}
+
+# Legacy text verb (text before the first ':') -> parser for the rest of the text
+TEXT_COMMAND_PARSERS = {
+    "start": parse_start,
+    "stop": lambda payload: {},
+    "exec": lambda payload: {"command": payload},
+    "subscribe": parse_path,
+    "unsubscribe": parse_path,
+}
+
+def parse_command(message):
+    """Parse a frame into (op, arguments).
+
+    Accepts JSON objects such as {"op": "start", "hosts": 4, "topology": "star",
+    "meshType": "partial"} in text or binary frames, as well as the older
+    "start:4:star:partial" / "stop" / "exec:<command>" text commands and
+    "subscribe:<src>:<dst>" / "unsubscribe:<src>:<dst>".
+    """
+    data = message.get("bytes")
+    if data is None:
+        text = message.get("text") or ""
+        if not text.startswith("{"):
+            verb, _, payload = text.partition(":")
+            parser = TEXT_COMMAND_PARSERS.get(verb)
+            return verb, parser(payload) if parser else {}
+        data = text
+    args = orjson.loads(data)
+    return args.pop("op", None), args
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    global network
     await websocket.accept()
-    connected_clients.append(websocket)
-    await websocket.send_text("Connection successful...")
+    client = ClientState(websocket, asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE))
+    client.writer = asyncio.create_task(client_writer(client))
+    connected_clients.add(client)
+    unfiltered_clients.add(client)
+    enqueue(client, "Connection successful...")
 
     try:
         while True:
-            command = await websocket.receive_text()
-            print(f"Received: {command}")
-
-            if command.startswith("start:"):
-                _, hosts_num, topology, meshType = command.split(":")
-                hosts = int(hosts_num)
-                response = await start_mininet(hosts, topology, meshType)
-                await websocket.send_json(response)
-
-            elif command == "stop":
-                if network:
-                    network = None
-                    await websocket.send_json({"message": "Mininet stopped.", "type": "message"})
-                else:
-                    await websocket.send_json({"message": "No active Mininet session.", "type": "message"})
-
-            elif command.startswith("exec:"):
-                cmd = command.split(":")[1].strip()
-                print(f"Executing {cmd}...")
-                result = await execute_mininet_command(cmd)
-                await websocket.send_json(result)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            log.debug("Received: %s", message.get('text') or message.get('bytes'))
+
+            op, args = parse_command(message)
+            handler = COMMAND_HANDLERS.get(op)
+            if handler:
+                await handler(client, **args)
+            else:
+                log.warning("Unknown command: %s", op)
 
     except WebSocketDisconnect:
         # Handle normal disconnection gracefully
-        connected_clients.remove(websocket)
-        print("Client disconnected")
+        await release_client(client, flush=False)
+        log.info("Client disconnected")
     except Exception as e:
-        print(f"Error: {str(e)}")
-        try:
-            await websocket.send_json({"message": f"Error: {str(e)}", "type": "message"})
-        except RuntimeError:
-            # If we can't send because the connection is already closed, just log it
-            print("Could not send error message - connection already closed")
-
-        if websocket in connected_clients:
-            connected_clients.remove(websocket)
+        log.error("Error: %s", e)
+        # Let the writer deliver the error before the connection is closed
+        enqueue(client, orjson.dumps({"message": f"Error: {str(e)}", "type": "message"}).decode())
+        await release_client(client, flush=True)
 
 @app.head("/path-data")
 async def head_path_data():
     # This simply allows HEAD requests to check if the endpoint is available
     return {}
 
-@app.post("/path-data")
-async def receive_path_data(data: dict):
+async def accept_path_data(data: dict) -> bool:
+    """Tag one path data record for the Flutter app and queue it for broadcast."""
     global last_data_received
-    print(f"Received path data: {data}")
+    log.debug("Received path data: %s", data)
     
     # Update last data received timestamp
-    last_data_received = datetime.now()
+    last_data_received = time.monotonic()
     
     # Add a message type for the Flutter app to recognize
     data["type"] = "path_data"
     
-    # Log the data being broadcasted
-    print(f"Broadcasting path data: {data}")
-    
     # Use rate-limited broadcast
     broadcast_sent = await rate_limited_broadcast(data)
     
     if broadcast_sent:
-        print(f"Successfully broadcasted path data to clients")
+        log.debug("Successfully broadcasted path data to clients")
     else:
-        print(f"Path data broadcast was rate-limited")
-    
+        log.debug("Path data broadcast was rate-limited")
+    return broadcast_sent
+
+@app.post("/path-data")
+async def receive_path_data(data: dict):
+    broadcast_sent = await accept_path_data(data)
     return {"status": "success", "broadcast_sent": broadcast_sent}
 
+@app.post("/path-data/batch")
+async def receive_path_data_batch(batch: dict):
+    # {"events": [<path data>, ...]} as sent by the controller's flush
+    events = batch.get("events", [])
+    broadcasts_sent = 0
+    for data in events:
+        broadcasts_sent += await accept_path_data(data)
+    return {"status": "success", "received": len(events), "broadcasts_sent": broadcasts_sent}
+
+# Topology name -> builder taking (hosts_num, meshType)
+TOPOLOGY_BUILDERS = {
+    "star": lambda hosts_num, meshType: StarTopo(hosts_num),
+    "fattree": lambda hosts_num, meshType: FatTree(hosts_num),
+    "ring": lambda hosts_num, meshType: RingTopo(hosts_num),
+    "mesh": lambda hosts_num, meshType: PartialMeshTopo(hosts_num) if meshType == "partial" else FullMeshTopo(hosts_num),
+    "tree": lambda hosts_num, meshType: TreeTopo(hosts_num),
+    "custom": lambda hosts_num, meshType: CustomTopo(num_hosts=hosts_num),
+}
+
 async def start_mininet(hosts_num, topology, meshType):
-    global network
+    global network, topology_data
     setLogLevel("info")
 
     try:
-        os.system("sudo mn -c")  # Clean previous Mininet sessions
+        # Clean previous Mininet sessions without blocking the event loop
+        cleanup = await asyncio.create_subprocess_exec(
+            "sudo", "mn", "-c",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            await asyncio.wait_for(cleanup.wait(), MININET_CLEANUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            cleanup.kill()
+            log.warning("Mininet cleanup did not finish within %ss, continuing", MININET_CLEANUP_TIMEOUT)
 
-        print(f"Starting Mininet with {hosts_num} hosts, topology: {topology}")
+        log.info("Starting Mininet with %s hosts, topology: %s", hosts_num, topology)
         
-        if topology == "star":
-            topo = StarTopo(hosts_num)
-        elif topology == "fattree":
-            topo = FatTree(hosts_num)
-        elif topology == "ring":
-            topo = RingTopo(hosts_num)
-        elif topology == "mesh":
-            if meshType == "partial":
-                topo = PartialMeshTopo(hosts_num)
-            else:
-                topo = FullMeshTopo(hosts_num)
-        elif topology == "tree":
-            topo = TreeTopo(hosts_num)
-        elif topology == "custom":
-            topo = CustomTopo(hosts_num, switches)
-        else:
+        builder = TOPOLOGY_BUILDERS.get(topology)
+        if builder is None:
             return {"message": "Invalid topology", "status": "failed"}
+        topo = builder(hosts_num, meshType)
 
-        net = Mininet(topo=topo, controller=lambda name: RemoteController(name, ip="127.0.0.1", port=6633))
-        net.start()
+        # Building the network creates the nodes and interfaces, so it blocks too
+        net = await run_blocking(lambda: Mininet(
+            topo=topo,
+            controller=lambda name: RemoteController(name, ip="127.0.0.1", port=6633)
+        ))
+        await run_blocking(net.start)
 
         topology_data = {
             "hosts": [h.name for h in net.hosts],
             "switches": [s.name for s in net.switches],
-            "links": [(link.intf1.node.name, link.intf2.node.name) for link in net.links],
+            "links": list(map(link_endpoints, net.links)),
         }
 
         network = net
+        topology_text.clear()
+        nodes_by_name.clear()
+        nodes_by_name.update((node.name, node) for node in net.hosts + net.switches)
 
         return {"message": "Mininet started successfully!", "topology": topology_data, "status": "success"}
 
@@ -136,25 +413,213 @@ async def start_mininet(hosts_num, topology, meshType):
         return {"message": f"Error starting Mininet: {str(e)}", "status": "error", "type": "mininet"}
 
 
+async def run_pingall(parts, command_id):
+    """Handle pingall: ping between every pair of hosts."""
+    log.debug("Executing pingall command...")
+    result = await run_blocking(network.pingAll)
+    # Update command status
+    try:
+        queue_status_update(
+            command_id,
+            "completed",
+            {"result": result}
+        )
+        log.debug("Queued pingall command status update")
+    except Exception as e:
+        log.error("Error updating pingall command status: %s", e)
+    return {"message": f"PingAll output: {result}", "result": result, "status": "success", "type": "pingall"}
+
+async def run_ping(parts, command_id):
+    """Handle ping <host1> <host2>: send one ping between two hosts."""
+    if len(parts) < 3:
+        return {"message": "Invalid ping command format. Use: ping <host1> <host2>", "status": "error"}
+    
+    host1_name = parts[1]
+    host2_name = parts[2]
+    
+    log.debug("Attempting to ping from %s to %s", host1_name, host2_name)
+    
+    try:
+        host1 = nodes_by_name.get(host1_name)
+        host2 = nodes_by_name.get(host2_name)
+        
+        if not host1 or not host2:
+            error_msg = f"Host not found: {host1_name if not host1 else host2_name}"
+            log.error(error_msg)
+            try:
+                queue_status_update(
+                    command_id,
+                    "error",
+                    {"error": error_msg}
+                )
+            except Exception as e:
+                log.error("Error updating command status: %s", e)
+            return {"message": error_msg, "status": "error"}
+        
+        log.debug("Host1 IP: %s, Host2 IP: %s", host1.IP(), host2.IP())
+        # Run in a worker thread so the ping RTT does not block the event loop
+        result = await run_blocking(host1.cmd, f"ping -c 1 -W 1 {host2.IP()}")
+        log.debug("Ping result: %s", result)
+        
+        isSuccessful = PING_SUCCESS.search(result) is not None
+        
+        # Update command status
+        try:
+            queue_status_update(
+                command_id,
+                "completed",
+                {
+                    "result": result,
+                    "success": isSuccessful,
+                    "source": host1_name,
+                    "destination": host2_name
+                }
+            )
+            log.debug("Queued ping command status update")
+        except Exception as e:
+            log.error("Error updating ping command status: %s", e)
+        
+        if isSuccessful:
+            return {
+                "message": f"ping from {host1_name} to {host2_name} success",
+                "source": host1_name,
+                "destination": host2_name,
+                "result": result,
+                "status": "success",
+                "type": "ping"
+            }
+        else:
+            return {
+                "message": f"ping from {host1_name} to {host2_name} failed",
+                "source": host1_name,
+                "destination": host2_name,
+                "result": result,
+                "status": "failed",
+                "type": "ping"
+            }
+    except Exception as e:
+        error_msg = f"Error executing ping: {str(e)}"
+        log.error(error_msg)
+        try:
+            queue_status_update(
+                command_id,
+                "error",
+                {"error": error_msg}
+            )
+        except Exception as e:
+            log.error("Error updating command status: %s", e)
+        return {"message": error_msg, "status": "error"}
+
+def format_dump(topology):
+    """Format the dump output for a topology snapshot."""
+    return "".join([
+        "Network Topology Information:\n\n",
+        "Hosts:\n",
+        *(f"- {host}\n" for host in topology["hosts"]),
+        "\nSwitches:\n",
+        *(f"- {switch}\n" for switch in topology["switches"]),
+        "\nLinks:\n",
+        *(f"- {link[0]} <-> {link[1]}\n" for link in topology["links"]),
+    ])
+
+def format_net(topology):
+    """Format the net output for a topology snapshot."""
+    return "Network Links:\n" + "".join(f"- {link[0]} <-> {link[1]}\n" for link in topology["links"])
+
+def cached_topology_text(name, formatter):
+    """Return formatted topology text, building it once per started network."""
+    text = topology_text.get(name)
+    if text is None:
+        text = topology_text[name] = formatter(topology_data)
+    return text
+
+async def run_dump(parts, command_id):
+    """Handle dump: list the hosts, switches and links."""
+    dump_output = cached_topology_text("dump", format_dump)
+    log.debug("%s", dump_output)
+    return {
+        "message": "Network topology information retrieved",
+        "result": dump_output,
+        "status": "success",
+        "type": "topology"
+    }
+
+async def run_net(parts, command_id):
+    """Handle net: list the links."""
+    net_output = cached_topology_text("net", format_net)
+    log.debug("%s", net_output)
+    return {
+        "message": "Network topology information retrieved",
+        "result": net_output,
+        "status": "success",
+        "type": "topology"
+    }
+
+async def run_ifconfig(parts, command_id):
+    """Handle <host> ifconfig: show a host's interfaces."""
+    h = parts[0]
+    host = nodes_by_name[h]
+    result = await run_blocking(host.cmd, 'ifconfig')
+    log.debug("%s", result)
+    return {
+        "message": f"ifconfig output: {result}",
+        "host": h, 
+        "result": result, 
+        "status": "success", 
+        "type": "ifconfig"
+    }
+
+async def run_logs(parts, command_id):
+    """Handle <host> logs: show a host's recent kernel log."""
+    h = parts[0]
+    host = nodes_by_name[h]
+    # Get system logs with timestamp and process information
+    result = await run_blocking(host.cmd, 'dmesg | tail -n 20')
+    log.debug("%s", result)
+    return {
+        "message": f"System logs retrieved for {h}",
+        "host": h,
+        "result": result,
+        "status": "success",
+        "type": "logs"
+    }
+
+async def run_command(cmd, command_id):
+    """Any other command, run on the network as-is."""
+    result = await run_blocking(network.run, cmd)
+    # Update command status
+    queue_status_update(
+        command_id,
+        "completed",
+        {"result": result}
+    )
+    return {"message": f"Command output: {result}", "status": "success", "type": "command"}
+
+# First word of a command -> (handler, command type)
+MININET_COMMANDS = {
+    "pingall": (run_pingall, "pingall"),
+    "ping": (run_ping, "ping"),
+    "dump": (run_dump, "topology"),
+    "net": (run_net, "topology"),
+}
+
+# Second word of a "<host> <command>" command -> (handler, command type)
+HOST_COMMANDS = {
+    "ifconfig": (run_ifconfig, "ifconfig"),
+    "logs": (run_logs, "logs"),
+}
+
 async def execute_mininet_command(cmd):
-    global network
     if network:
         try:
-            print(f"Executing command: {cmd}")
-            # Determine command type
-            command_type = None
-            if cmd == "pingall":
-                command_type = "pingall"
-            elif cmd.startswith("ping"):
-                command_type = "ping"
-            elif cmd == "dump" or cmd == "net":
-                command_type = "topology"
-            elif "ifconfig" in cmd:
-                command_type = "ifconfig"
-            elif "logs" in cmd:
-                command_type = "logs"
-            else:
-                command_type = "command"
+            log.info("Executing command: %s", cmd)
+            # Split once and resolve the handler (and command type) from the table
+            parts = cmd.split()
+            handler, command_type = (
+                MININET_COMMANDS.get(parts[0] if parts else "")
+                or HOST_COMMANDS.get(parts[1] if len(parts) > 1 else "")
+                or (None, "command")
+            )
 
             # Add command to database with type
             try:
@@ -162,193 +627,24 @@ async def execute_mininet_command(cmd):
                     "command": cmd,
                     "source": "mininet",
                     "type": command_type,
-                    "status": "pending",
-                    "timestamp": datetime.now().isoformat()
+                    "status": "pending"
                 }
-                # Add command and get its ID
-                command_id = command_db.add_command(command_data)
+                # Add command and get its ID; add_command sets the timestamp
+                command_id = get_command_db().add_command(command_data)
                 if not command_id:
                     raise Exception("Failed to add command to database")
                 command_data["id"] = command_id
-                print(f"Added command to database with ID: {command_id} and type: {command_type}")
+                log.debug("Added command to database with ID: %s and type: %s", command_id, command_type)
             except Exception as e:
-                print(f"Error adding command to database: {e}")
+                log.error("Error adding command to database: %s", e)
                 return {"message": f"Error adding command to database: {e}", "status": "error"}
-            
-            if cmd == "pingall":
-                print("Executing pingall command...")
-                result = network.pingAll()
-                # Update command status
-                try:
-                    command_db.update_command_status(
-                        command_id,
-                        "completed",
-                        {"result": result}
-                    )
-                    print(f"Updated pingall command status to completed")
-                except Exception as e:
-                    print(f"Error updating pingall command status: {e}")
-                return {"message": f"PingAll output: {result}", "result": result, "status": "success", "type": "pingall"}
-            elif cmd.startswith("ping"):
-                # Split the command and handle different formats
-                parts = cmd.split()
-                if len(parts) < 3:
-                    return {"message": "Invalid ping command format. Use: ping <host1> <host2>", "status": "error"}
-                
-                host1_name = parts[1]
-                host2_name = parts[2]
-                
-                print(f"Attempting to ping from {host1_name} to {host2_name}")
-                
-                try:
-                    host1 = network.get(host1_name)
-                    host2 = network.get(host2_name)
-                    
-                    if not host1 or not host2:
-                        error_msg = f"Host not found: {host1_name if not host1 else host2_name}"
-                        print(error_msg)
-                        try:
-                            command_db.update_command_status(
-                                command_id,
-                                "error",
-                                {"error": error_msg}
-                            )
-                        except Exception as e:
-                            print(f"Error updating command status: {e}")
-                        return {"message": error_msg, "status": "error"}
-                    
-                    print(f"Host1 IP: {host1.IP()}, Host2 IP: {host2.IP()}")
-                    result = host1.cmd(f"ping -c 1 {host2.IP()}")
-                    print(f"Ping result: {result}")
-                    
-                    isSuccessful = "0% packet loss" in result
-                    
-                    # Update command status
-                    try:
-                        command_db.update_command_status(
-                            command_id,
-                            "completed",
-                            {
-                                "result": result,
-                                "success": isSuccessful,
-                                "source": host1_name,
-                                "destination": host2_name
-                            }
-                        )
-                        print(f"Updated ping command status to completed")
-                    except Exception as e:
-                        print(f"Error updating ping command status: {e}")
-                    
-                    if isSuccessful:
-                        return {
-                            "message": f"ping from {host1_name} to {host2_name} success",
-                            "source": host1_name,
-                            "destination": host2_name,
-                            "result": result,
-                            "status": "success",
-                            "type": "ping"
-                        }
-                    else:
-                        return {
-                            "message": f"ping from {host1_name} to {host2_name} failed",
-                            "source": host1_name,
-                            "destination": host2_name,
-                            "result": result,
-                            "status": "failed",
-                            "type": "ping"
-                        }
-                except Exception as e:
-                    error_msg = f"Error executing ping: {str(e)}"
-                    print(error_msg)
-                    try:
-                        command_db.update_command_status(
-                            command_id,
-                            "error",
-                            {"error": error_msg}
-                        )
-                    except Exception as e:
-                        print(f"Error updating command status: {e}")
-                    return {"message": error_msg, "status": "error"}
-            elif cmd == 'dump':
-                # Get network topology information
-                hosts = [h.name for h in network.hosts]
-                switches = [s.name for s in network.switches]
-                links = [(link.intf1.node.name, link.intf2.node.name) for link in network.links]
-                
-                # Format the dump output
-                dump_output = "Network Topology Information:\n\n"
-                dump_output += "Hosts:\n"
-                for host in hosts:
-                    dump_output += f"- {host}\n"
-                
-                dump_output += "\nSwitches:\n"
-                for switch in switches:
-                    dump_output += f"- {switch}\n"
-                
-                dump_output += "\nLinks:\n"
-                for link in links:
-                    dump_output += f"- {link[0]} <-> {link[1]}\n"
-                
-                print(dump_output)
-                return {
-                    "message": "Network topology information retrieved",
-                    "result": dump_output,
-                    "status": "success",
-                    "type": "topology"
-                }
-            elif cmd == 'net':
-                # Get network topology information
-                links = [(link.intf1.node.name, link.intf2.node.name) for link in network.links]
-                
-                # Format the net output
-                net_output = "Network Links:\n"
-                for link in links:
-                    net_output += f"- {link[0]} <-> {link[1]}\n"
-                
-                print(net_output)
-                return {
-                    "message": "Network topology information retrieved",
-                    "result": net_output,
-                    "status": "success",
-                    "type": "topology"
-                }
-            elif cmd.split(' ')[1] == 'ifconfig':
-                h = cmd.split(' ')[0]
-                host = network.get(h)
-                result = host.cmd('ifconfig')
-                print(result)
-                return {
-                    "message": f"ifconfig output: {result}",
-                    "host": h, 
-                    "result": result, 
-                    "status": "success", 
-                    "type": "ifconfig"
-                }
-            elif cmd.split(' ')[1] == 'logs':
-                h = cmd.split(' ')[0]
-                host = network.get(h)
-                # Get system logs with timestamp and process information
-                result = host.cmd('dmesg | tail -n 20')
-                print(result)
-                return {
-                    "message": f"System logs retrieved for {h}",
-                    "host": h,
-                    "result": result,
-                    "status": "success",
-                    "type": "logs"
-                }
-            else:
-                result = network.run(cmd)
-                # Update command status
-                command_db.update_command_status(
-                    command_id,
-                    "completed",
-                    {"result": result}
-                )
-                return {"message": f"Command output: {result}", "status": "success", "type": "command"}
+
+            if handler:
+                return await handler(parts, command_id)
+            return await run_command(cmd, command_id)
         except Exception as e:
             # Update command status with error
-            command_db.update_command_status(
+            queue_status_update(
                 command_id,
                 "error",
                 {"error": str(e)}
@@ -356,34 +652,61 @@ async def execute_mininet_command(cmd):
             return {"message": f"Error executing command: {str(e)}", "status": "error", "type": "command"}
     return {"message": "No active Mininet session.", "type": "message"}
 
-# python3 -m uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+# python3 -m uvicorn main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools --ws-per-message-deflate false --reload
 
-async def broadcast_to_clients(message: dict):
-    """Send message to all connected WebSocket clients."""
-    # Create a copy of the list to avoid issues if it changes during iteration
-    clients = connected_clients.copy()
-    
-    for client in clients:
-        try:
-            print(f"Sending message to client: {message}")
-            await client.send_json(message)
-        except Exception as e:
-            print(f"Error broadcasting to client: {e}")
-            # Client might be disconnected but not properly removed
-            if client in connected_clients:
-                connected_clients.remove(client)
+async def broadcast_to_clients(routes: list):
+    """Queue already JSON-encoded messages, given as (client, payloads) pairs."""
+    log.debug("Sending messages to %d clients", len(routes))
+
+    # Each client's writer task sends at its own pace; clients that fall
+    # too far behind are disconnected instead of delaying the broadcast
+    slow_clients = [
+        client for client, payloads in routes
+        if not all(enqueue(client, payload) for payload in payloads)
+    ]
+    if slow_clients:
+        await asyncio.gather(*(evict_client(client) for client in slow_clients))
+
+async def path_data_broadcaster():
+    """Broadcast queued path data, making one pass over the clients per batch window."""
+    global pending_path_data
+    while True:
+        await path_data_ready.wait()
+        # Let the rest of a burst (e.g. the pong following a ping) arrive
+        await asyncio.sleep(PATH_DATA_BATCH_WINDOW)
+        path_data_ready.clear()
+        batch, pending_path_data = pending_path_data, []
+        # Clients without subscriptions get everything, in arrival order
+        payloads = [payload for _, payload in batch]
+        # Building routes never awaits, so the set cannot change while it is
+        # iterated and routes itself is the snapshot the broadcast works from
+        routes = [(client, payloads) for client in unfiltered_clients]
+        # Subscribed clients only get the paths they asked for
+        routed = {}
+        for path_key, payload in batch:
+            for client in path_subscribers.get(path_key, ()):
+                routed.setdefault(client, []).append(payload)
+        routes.extend(routed.items())
+        await broadcast_to_clients(routes)
 
 async def rate_limited_broadcast(data: dict):
     """Broadcast with rate limiting based on source/destination pair"""
-    path_key = f"{data['src']}-{data['dst']}"
-    current_time = time.time()
+    path_key = (data['src'], data['dst'])
+    current_time = time.monotonic()
     
     # Only broadcast if enough time has passed since last broadcast for this path
-    if path_key not in last_broadcast_time or (current_time - last_broadcast_time[path_key]) >= BROADCAST_COOLDOWN:
+    last_time = last_broadcast_time.get(path_key)
+    if last_time is None or (current_time - last_time) >= BROADCAST_COOLDOWN:
         last_broadcast_time[path_key] = current_time
-        print(f"Broadcasting to {len(connected_clients)} connected clients")
-        await broadcast_to_clients(data)
+        last_broadcast_time.move_to_end(path_key)
+        # Forget the least recently broadcast paths once the table is full
+        if len(last_broadcast_time) > MAX_RATE_LIMITED_PATHS:
+            last_broadcast_time.popitem(last=False)
+        log.debug("Queueing path data for %d connected clients", len(connected_clients))
+        # Encode once; the broadcaster sends the same text to every interested client
+        pending_path_data.append((path_key, orjson.dumps(data).decode()))
+        path_data_ready.set()
         return True
     else:
-        print(f"Rate limiting path data for {path_key}")
-        return False
\ No newline at end of file
+        log.debug("Rate limiting path data for %s-%s", *path_key)
+        return False
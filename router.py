@@ -6,10 +6,14 @@ from pox.lib.packet.icmp import icmp
 from pox.lib.packet.arp import arp
 from pox.lib.addresses import EthAddr, IPAddr
 import time
-import heapq
+import logging
+import re
 import json
-from collections import defaultdict
+import queue
+import threading
+from collections import OrderedDict, defaultdict, deque, namedtuple
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException, ConnectionError
 import sys
 import os
@@ -19,26 +23,45 @@ server_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__f
 sys.path.append(server_dir)
 
 
-from db.command_db import command_db
+from db.command_db import get_command_db
 
 log = core.getLogger()
 
 # FastAPI integration for sending data
 FASTAPI_URL = "http://127.0.0.1:8000/path-data"
+FASTAPI_BATCH_URL = FASTAPI_URL + "/batch"  # Accepts {"events": [<path data>, ...]}
 fastapi_available = False  # Flag to track if FastAPI server is available
-FASTAPI_RETRY_INTERVAL = 5  # Seconds between FastAPI connection retries
 MAX_FASTAPI_RETRIES = 3  # Maximum number of retries for FastAPI connection
 STARTUP_DELAY = 10  # Seconds to wait before first connection attempt
+FASTAPI_FAILURE_THRESHOLD = 3  # Failed batches in a row before path data is dropped
+FASTAPI_COOLDOWN = 30  # Seconds path data is dropped for once the threshold is hit
+fastapi_failures = 0  # Batches that failed after all retries since the last success
+fastapi_cooldown_until = 0.0  # Monotonic time until which path data is dropped
+fastapi_breaker_tripped = False  # True from the cooldown until a trial POST succeeds
+PATH_DATA_FLUSH_INTERVAL = 0.01  # Seconds to collect path data before sending it
+PATH_DATA_QUEUE_SIZE = 4096  # New path data is dropped beyond this many queued records
+PATH_DATA_BATCH_SIZE = 256  # Most path data records sent in one POST
+MAX_RETRY_DELAY = 8  # Upper bound in seconds for the send backoff
+path_data_queue = queue.Queue(maxsize=PATH_DATA_QUEUE_SIZE)  # Path data waiting to be sent
+
+# One keep-alive session for all FastAPI requests, so posts reuse a pooled
+# connection instead of opening a new TCP connection each time
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=0))
 
 # Data structures for topology and path tracking
 adjacency_list = defaultdict(dict)  # { switch: {neighbor: cost, ...}, ... }
-path_table = {}  # Caches shortest paths for faster forwarding
-host_to_switch = {}  # Stores {host_ip: switch_dpid}
+path_table = {}  # Caches shortest paths as {(src_switch, dst_switch): Route}
+next_hop = {}  # {(switch, dst_switch): next switch on a shortest path to dst_switch}
+hop_count = {}  # {(switch, dst_switch): number of links on a shortest path}
+path_edges = defaultdict(set)  # {(switch, next_switch): path_table keys whose route uses that link}
+host_to_switch = {}  # Stores {host_ip: switch_dpid}, IPs as IPAddr.toUnsigned() ints
 mac_to_port = {}  # Stores {mac: (switch_dpid, port)}
 dpid_to_name = {}  # Maps switch DPIDs to human-readable names
-ip_to_name = {}  # Map IP addresses to human-readable host names (h1, h2, etc.)
+ip_to_name = {}  # Map IP addresses (as ints) to human-readable host names (h1, h2, etc.)
 host_movement_count = {}  # Track host movement detections
-host_movement_time = {}  # Track last movement time for each host
+host_movement_time = {}  # Monotonic start of each host's current detection window
+host_movement_candidate = {}  # (dpid, port) the current detections were counted at
 MOVEMENT_COOLDOWN = 5  # Cooldown period in seconds
 MIN_MOVEMENT_DETECTIONS = 5  # Number of detections required to confirm movement
 
@@ -47,31 +70,39 @@ SWITCH_RECONNECT_TIMEOUT = 10  # Seconds to wait before considering a switch dis
 switch_last_seen = {}  # Track last seen time for each switch
 
 # Add ip_to_mac mapping dictionary near the top with other global variables
-ip_to_mac = {} # Stores {ip_address: mac_address}
+ip_to_mac = {} # Stores {ip_address: mac_address}, IPs as ints
+
+output_actions = {}  # Maps port numbers to reusable ofp_action_output instances
+
+COMMAND_ID_PATTERN = re.compile(rb'command_id:(\S+)')  # Command IDs tagged in packet payloads
 
 # Near the top of the file, add these variables
-LOG_RATE_LIMIT = {}  # Track last log time for rate-limited logs
+LOG_RATE_LIMIT = OrderedDict()  # rate_key -> monotonic time it was last logged
 LOG_RATE_INTERVAL = 5  # Seconds between rate-limited logs
+MAX_RATE_LIMITED_LOGS = 1024  # Rate keys remembered before the least recent is forgotten
 
-def rate_limited_log(logger, level, message, rate_key, interval=LOG_RATE_INTERVAL):
-    """Log a message, but rate-limit to avoid spam."""
-    current_time = time.time()
-    if rate_key not in LOG_RATE_LIMIT or current_time - LOG_RATE_LIMIT[rate_key] > interval:
+def rate_limited_log(logger, level, message, rate_key, *args, interval=LOG_RATE_INTERVAL):
+    """Log a message with lazy %-style args, but rate-limit to avoid spam."""
+    current_time = time.monotonic()
+    last_time = LOG_RATE_LIMIT.get(rate_key)
+    if last_time is None or current_time - last_time > interval:
         if level == "info":
-            logger.info(message)
+            logger.info(message, *args)
         elif level == "debug":
-            logger.debug(message)
+            logger.debug(message, *args)
         elif level == "warning":
-            logger.warning(message)
+            logger.warning(message, *args)
         LOG_RATE_LIMIT[rate_key] = current_time
+        LOG_RATE_LIMIT.move_to_end(rate_key)
+        # Bound the table however many distinct MACs and ports show up
+        if len(LOG_RATE_LIMIT) > MAX_RATE_LIMITED_LOGS:
+            LOG_RATE_LIMIT.popitem(last=False)
 
-def check_fastapi_connection():
-    """Verify if the FastAPI server is available with improved retry logic."""
+def probe_fastapi():
+    """Check once whether the FastAPI server is available, without waiting or retrying."""
     global fastapi_available
     try:
-        # Add a small delay before checking connection
-        time.sleep(1)
-        response = requests.head(FASTAPI_URL, timeout=2)
+        response = http_session.head(FASTAPI_URL, timeout=2)
         if response.status_code < 400:
             fastapi_available = True
             log.info(f"Connected to FastAPI server at {FASTAPI_URL}")
@@ -83,58 +114,96 @@ def check_fastapi_connection():
     except (RequestException, ConnectionError) as e:
         fastapi_available = False
         log.warning(f"Failed to connect to FastAPI server: {e}")
-        # Schedule a retry
-        from pox.lib.recoco import Timer
-        Timer(FASTAPI_RETRY_INTERVAL, check_fastapi_connection)
         return False
 
-def dijkstra(src, dst):
-    """Find the shortest path between switches using Dijkstra's algorithm."""
-    if src not in adjacency_list or dst not in adjacency_list:
-        log.warning(f"Dijkstra: Source {src} or destination {dst} not in adjacency list")
+def rebuild_next_hops():
+    """Recompute the all-pairs next-hop table from the adjacency list."""
+    # Every link costs one hop, so a BFS from each switch gives its shortest
+    # paths; the BFS parent of a node is its next hop towards the root
+    next_hop.clear()
+    hop_count.clear()
+    for dst in list(adjacency_list):
+        parents = {dst: dst}
+        hop_count[(dst, dst)] = 0
+        frontier = deque([dst])
+        while frontier:
+            node = frontier.popleft()
+            for neighbor in adjacency_list[node]:
+                if neighbor not in parents:
+                    parents[neighbor] = node
+                    next_hop[(neighbor, dst)] = node
+                    hop_count[(neighbor, dst)] = hop_count[(node, dst)] + 1
+                    frontier.append(neighbor)
+    log.debug("Rebuilt next-hop table for %d switches", len(adjacency_list))
+
+def shortest_path(src, dst):
+    """Return the switches on a shortest path from src to dst, or [] if unreachable."""
+    if (src, dst) not in next_hop:
+        log.warning(f"No path found from {src} to {dst}")
         return []
-
-    pq = [(0, src, [])]  # (cost, current switch, path)
-    visited = set()
-    distances = {src: 0}
-
-    while pq:
-        cost, node, path = heapq.heappop(pq)
-        if node in visited:
-            continue
-        path = path + [node]
-        if node == dst:
-            log.info(f"Dijkstra: Found path from {src} to {dst}: {path}")
-            return path
-        visited.add(node)
-
-        for neighbor, port in adjacency_list[node].items():
-            if neighbor not in visited:
-                neighbor_cost = cost + 1  # Use default cost of 1 per hop
-                if neighbor not in distances or neighbor_cost < distances[neighbor]:
-                    distances[neighbor] = neighbor_cost
-                    heapq.heappush(pq, (neighbor_cost, neighbor, path))
-
-    log.warning(f"Dijkstra: No path found from {src} to {dst}")
-    return []
+    path = [src]
+    while path[-1] != dst:
+        path.append(next_hop[(path[-1], dst)])
+    return path
+
+# A cached path with what forwarding needs already looked up:
+# path is a tuple of DPIDs, positions maps each DPID to its index in path and
+# out_ports maps each DPID but the last to its port towards the next switch
+Route = namedtuple("Route", ["path", "positions", "out_ports"])
+
+def make_route(path):
+    """Build a Route for a path, resolving its ports from the adjacency list."""
+    return Route(
+        tuple(path),
+        {dpid: i for i, dpid in enumerate(path)},
+        {dpid: adjacency_list[dpid][next_dpid] for dpid, next_dpid in zip(path, path[1:])},
+    )
+
+def cache_path(path):
+    """Cache a shortest path, its reverse, and the shorter paths it contains; return its Route."""
+    # Every prefix of a shortest path is itself a shortest path from the same
+    # source, and links are bidirectional, so each prefix also serves reversed
+    src = path[0]
+    for i in range(1, len(path) + 1):
+        prefix = path[:i]
+        path_table[(src, prefix[-1])] = make_route(prefix)
+        path_table[(prefix[-1], src)] = make_route(prefix[::-1])
+        # Index both routes by the links they use, for invalidate_link()
+        for link in zip(prefix, prefix[1:]):
+            path_edges[link].add((src, prefix[-1]))
+            path_edges[link[::-1]].add((prefix[-1], src))
+    return path_table[(src, path[-1])]
+
+def clear_paths():
+    """Drop every cached route."""
+    path_table.clear()
+    path_edges.clear()
+
+def invalidate_link(src, dst):
+    """Drop the cached routes that use the link between src and dst."""
+    affected = path_edges.pop((src, dst), set()) | path_edges.pop((dst, src), set())
+    # The index may still hold keys whose routes were already dropped
+    return sum(path_table.pop(path_key, None) is not None for path_key in affected)
+
+def drop_longer_routes():
+    """Drop cached routes longer than the current shortest path, e.g. after a link is added."""
+    stale = [path_key for path_key, route in path_table.items()
+             if len(route.path) - 1 > hop_count.get(path_key, len(route.path) - 1)]
+    for path_key in stale:
+        del path_table[path_key]
+    return len(stale)
 
 def send_path_data(packet_type, src_host, dst_host, path, ttl=None, time_ms=None):
-    """Send path data to the FastAPI endpoint."""
-    global fastapi_available
-    
-    log.info(f"Starting send_path_data: type={packet_type}, src={src_host}, dst={dst_host}")
-    log.info(f"Path: {path}, ttl={ttl}, time_ms={time_ms}")
-    
-    # Convert DPIDs to names
-    named_path = []
-    named_path.append(src_host)  # Add source host
-    
-    # Add switch DPIDs (convert to names if available)
-    for dpid in path:
-        switch_name = dpid_to_name.get(dpid, f"s{dpid}")
-        named_path.append(switch_name)
+    """Queue path data for the FastAPI endpoint."""
+    # Don't build or queue anything while FastAPI is known to be down
+    if time.monotonic() < fastapi_cooldown_until:
+        return False
+
+    log.debug("Starting send_path_data: type=%s, src=%s, dst=%s", packet_type, src_host, dst_host)
+    log.debug("Path: %s, ttl=%s, time_ms=%s", path, ttl, time_ms)
     
-    named_path.append(dst_host)  # Add destination host
+    # Source host, switch names (seeded when each switch connects), destination host
+    named_path = [src_host, *[dpid_to_name[dpid] for dpid in path], dst_host]
     
     data = {
         "type": packet_type,
@@ -146,74 +215,149 @@ def send_path_data(packet_type, src_host, dst_host, path, ttl=None, time_ms=None
         "direction": "src_to_dst"
     }
     
-    log.info(f"Preparing to send path data: {json.dumps(data)}")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Preparing to send path data: %s", json.dumps(data))
     
-    def _send_to_fastapi():
-        global fastapi_available
-        max_retries = MAX_FASTAPI_RETRIES
-        retry_delay = 1
-        
-        for attempt in range(max_retries):
-            try:
-                if not fastapi_available:
-                    log.info("FastAPI server not available, attempting to reconnect...")
-                    if check_fastapi_connection():
-                        log.info("Reconnected to FastAPI server")
-                    else:
-                        log.warning(f"Failed to reconnect to FastAPI server (attempt {attempt + 1}/{max_retries})")
-                        time.sleep(retry_delay)
-                        continue
-                
-                log.info(f"Sending path data to FastAPI server (attempt {attempt + 1}/{max_retries})")
-                response = requests.post(FASTAPI_URL, json=data, timeout=2)
-                if response.status_code == 200:
-                    log.info(f"Successfully sent path data to {FASTAPI_URL}")
-                    return True
+    # The HTTP worker thread does the POST, so packet handling never waits on it
+    try:
+        path_data_queue.put_nowait(data)
+    except queue.Full:
+        log.warning("Path data queue full, dropping path data for %s -> %s", src_host, dst_host)
+        return False
+    return True
+
+def _path_data_worker():
+    """Send queued path data to the FastAPI endpoint in batched POSTs."""
+    # The first connection check happens here rather than on a recoco Timer,
+    # so no HTTP request ever blocks the scheduler; later ones are made by
+    # _send_to_fastapi before it posts
+    time.sleep(STARTUP_DELAY)
+    probe_fastapi()
+    while True:
+        batch = [path_data_queue.get()]
+        # Packets seen within one flush interval are sent together
+        time.sleep(PATH_DATA_FLUSH_INTERVAL)
+        try:
+            while len(batch) < PATH_DATA_BATCH_SIZE:
+                batch.append(path_data_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if time.monotonic() < fastapi_cooldown_until:
+            # Queued before the breaker tripped; FastAPI is still considered down
+            continue
+        _send_to_fastapi({"events": batch})
+
+def _send_to_fastapi(data):
+    """Post a batch of path data to the FastAPI endpoint, retrying on failure."""
+    global fastapi_available, fastapi_failures, fastapi_cooldown_until, fastapi_breaker_tripped
+    if fastapi_breaker_tripped:
+        # Half-open after the cooldown: one POST, without probing or retrying,
+        # either closes the breaker or starts another cooldown
+        try:
+            response = http_session.post(FASTAPI_BATCH_URL, json=data, timeout=2)
+            sent = response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            log.debug("Trial path data POST failed: %s", e)
+            sent = False
+        if sent:
+            fastapi_breaker_tripped = False
+            fastapi_available = True
+            log.info("FastAPI reachable again, resuming path data")
+            return True
+        fastapi_cooldown_until = time.monotonic() + FASTAPI_COOLDOWN
+        log.warning(f"FastAPI still unreachable, dropping path data for {FASTAPI_COOLDOWN} seconds")
+        return False
+
+    max_retries = MAX_FASTAPI_RETRIES
+    retry_delay = 0.5
+    
+    for attempt in range(max_retries):
+        # Back off exponentially; this only ever delays the worker thread
+        retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+        try:
+            if not fastapi_available:
+                log.info("FastAPI server not available, attempting to reconnect...")
+                if probe_fastapi():
+                    log.info("Reconnected to FastAPI server")
                 else:
-                    log.warning(f"Failed to send path data: HTTP {response.status_code}")
-                    fastapi_available = False
+                    log.warning(f"Failed to reconnect to FastAPI server (attempt {attempt + 1}/{max_retries})")
                     time.sleep(retry_delay)
-            except requests.exceptions.Timeout:
-                log.warning(f"Timeout sending path data (attempt {attempt + 1}/{max_retries})")
-                fastapi_available = False
-                time.sleep(retry_delay)
-            except requests.exceptions.RequestException as e:
-                log.warning(f"Error sending path data: {e}")
+                    continue
+            
+            log.debug("Sending %d path data records to FastAPI server (attempt %d/%d)", len(data['events']), attempt + 1, max_retries)
+            response = http_session.post(FASTAPI_BATCH_URL, json=data, timeout=2)
+            if response.status_code == 200:
+                log.debug("Successfully sent path data to %s", FASTAPI_BATCH_URL)
+                fastapi_failures = 0
+                return True
+            else:
+                log.warning(f"Failed to send path data: HTTP {response.status_code}")
                 fastapi_available = False
                 time.sleep(retry_delay)
-        
-        log.warning("Failed to send path data after all retries")
-        return False
+        except requests.exceptions.Timeout:
+            log.warning(f"Timeout sending path data (attempt {attempt + 1}/{max_retries})")
+            fastapi_available = False
+            time.sleep(retry_delay)
+        except requests.exceptions.RequestException as e:
+            log.warning(f"Error sending path data: {e}")
+            fastapi_available = False
+            time.sleep(retry_delay)
     
-    # Use a timer to send the data asynchronously
-    from pox.lib.recoco import Timer
-    Timer(0.1, _send_to_fastapi)
-    return True
-
-def install_path_flows(connection, packet, path):
-    """Install flow rules for the given path."""
+    log.warning("Failed to send path data after all retries")
+    fastapi_failures += 1
+    if fastapi_failures >= FASTAPI_FAILURE_THRESHOLD:
+        # Stop paying for the retry loop on every batch while the server is down
+        fastapi_cooldown_until = time.monotonic() + FASTAPI_COOLDOWN
+        fastapi_failures = 0
+        fastapi_breaker_tripped = True
+        log.warning(f"FastAPI unreachable, dropping path data for {FASTAPI_COOLDOWN} seconds")
+    return False
+
+def install_path_flows(connection, packet, route, buffer_id=None, dst_port=None):
+    """Install flow rules on this switch and every switch after it on the route.
+
+    dst_port is the last switch's port to the destination host, if known.
+    Returns True if the current switch was told to apply the new flow to the
+    buffered packet, in which case no separate PacketOut is needed for it.
+    """
     # Get the current switch
     current_switch = connection.dpid
+    match = of.ofp_match.from_packet(packet)
+    buffered = False
     
-    # Find the next hop in the path
-    current_index = path.index(current_switch)
-    if current_index < len(path) - 1:
-        next_switch = path[current_index + 1]
-        out_port = adjacency_list[current_switch][next_switch]
-                
+    # Push the flows for the rest of the path now, so the packet does not
+    # come back to the controller from each switch it reaches
+    for dpid in route.path[route.positions[current_switch]:]:
+        out_port = route.out_ports.get(dpid, dst_port)
+        if out_port is None:
+            continue  # Last switch, host port not learned yet
+        switch_connection = connection if dpid == current_switch else core.openflow.getConnection(dpid)
+        if switch_connection is None:
+            continue
+        
         # Install the forwarding rule
         msg = of.ofp_flow_mod()
-        msg.match = of.ofp_match.from_packet(packet)
-        msg.actions.append(of.ofp_action_output(port=out_port))
+        msg.match = match
+        msg.actions.append(output_action(out_port))
         msg.idle_timeout = 10  # Flow expires after 10 seconds of inactivity
         msg.hard_timeout = 30  # Flow expires after 30 seconds regardless
-        connection.send(msg)
+        # Let the switch release its buffered copy of the packet through the new flow
+        if dpid == current_switch and buffer_id is not None and buffer_id != of.NO_BUFFER:
+            msg.buffer_id = buffer_id
+            buffered = True
+        switch_connection.send(msg)
         
-        log.info(f"Installed flow rule on switch {current_switch}: {packet.src} -> {packet.dst} via port {out_port}")
+        rate_limited_log(log, "info", "Installed flow rule on switch %s: %s -> %s via port %s",
+                         ("flow", dpid, packet.src, packet.dst),
+                         dpid, packet.src, packet.dst, out_port)
+    return buffered
 
 def _handle_ConnectionUp(event):
     """Handle switch connection events."""
     switch_last_seen[event.dpid] = time.time()
+    # Name the switch up front so path data never has to format it per packet
+    if event.dpid not in dpid_to_name:
+        dpid_to_name[event.dpid] = f"s{event.dpid}"
     log.info(f"Switch {event.dpid} connected")
     
     # Install ICMP flow rule immediately
@@ -223,14 +367,14 @@ def _handle_ConnectionUp(event):
     icmp_msg.match.dl_type = 0x800  # IP
     icmp_msg.match.nw_proto = 1     # ICMP
     icmp_msg.priority = 65535       # Highest priority
-    icmp_msg.actions.append(of.ofp_action_output(port=of.OFPP_CONTROLLER))
+    icmp_msg.actions.append(output_action(of.OFPP_CONTROLLER))
     event.connection.send(icmp_msg)
     log.info(f"Installed ICMP flow rule on switch {event.dpid}")
     
     # Clear any stale paths involving this switch
-    for path in list(path_table.keys()):
-        if event.dpid in path:
-            del path_table[path]
+    for path_key, route in list(path_table.items()):
+        if event.dpid in route.positions:
+            del path_table[path_key]
 
 def _handle_ConnectionDown(event):
     """Handle switch disconnection events."""
@@ -242,6 +386,8 @@ def _handle_ConnectionDown(event):
         if neighbor in adjacency_list:
             del adjacency_list[neighbor][event.dpid]
     adjacency_list[event.dpid].clear()
+    clear_paths()
+    rebuild_next_hops()
     
     # Clear host mappings for this switch
     for mac, switch in list(host_to_switch.items()):
@@ -263,50 +409,75 @@ def _handle_PacketIn(event):
     if not eth:
         return
 
-    # Track MAC address to switch/port mapping
-    src_mac = str(eth.src)
+    # Track MAC address to switch/port mapping; format each MAC once and
+    # intern it, so the long-lived tables share one string per address
+    src_mac = sys.intern(str(eth.src))
+    dst_mac = sys.intern(str(eth.dst))
     
     # Skip multicast and broadcast MAC addresses
     if eth.src.is_multicast or eth.src.is_broadcast:
-        log.warning(f"Ignoring packet with broadcast/multicast source MAC: {src_mac}")
+        log.warning("Ignoring packet with broadcast/multicast source MAC: %s", src_mac)
         return
     
     # Check if this MAC is already mapped to a switch/port
     if src_mac in mac_to_port:
         current_switch, current_port = mac_to_port[src_mac]
         
-        # Only update if the switch has changed (host moved)
+        # Only update if the switch has changed (host moved), and only once the
+        # host has been seen at the same new switch and port
+        # MIN_MOVEMENT_DETECTIONS times within MOVEMENT_COOLDOWN; copies of one
+        # packet reaching different transit switches restart the count
         if current_switch != dpid:
-            mac_to_port[src_mac] = (dpid, event.port)
-            rate_limited_log(log, "debug", f"Host {src_mac} moved from switch {current_switch} to switch {dpid}, port {event.port}", f"host_move_{src_mac}")
+            now = time.monotonic()
+            candidate = (dpid, event.port)
+            window_start = host_movement_time.get(src_mac)
+            if (host_movement_candidate.get(src_mac) != candidate
+                    or now - window_start > MOVEMENT_COOLDOWN):
+                host_movement_candidate[src_mac] = candidate
+                host_movement_time[src_mac] = now
+                host_movement_count[src_mac] = 0
+            host_movement_count[src_mac] += 1
+            if host_movement_count[src_mac] >= MIN_MOVEMENT_DETECTIONS:
+                mac_to_port[src_mac] = candidate
+                del host_movement_count[src_mac]
+                del host_movement_time[src_mac]
+                del host_movement_candidate[src_mac]
+                rate_limited_log(log, "debug", "Host %s moved from switch %s to switch %s, port %s", ("host_move", src_mac),
+                                 src_mac, current_switch, dpid, event.port)
+        elif src_mac in host_movement_count:
+            # Seen at its known switch again; drop the pending detections
+            del host_movement_count[src_mac]
+            del host_movement_time[src_mac]
+            del host_movement_candidate[src_mac]
     else:
         # New MAC address
         mac_to_port[src_mac] = (dpid, event.port)
-        log.debug(f"Learned new MAC {src_mac} on switch {dpid}, port {event.port}")
+        log.debug("Learned new MAC %s on switch %s, port %s", src_mac, dpid, event.port)
 
     # Handle ARP packets specially
     if eth.type == ethernet.ARP_TYPE:
-        log.debug(f"Processing ARP packet from {eth.src} to {eth.dst}")
+        log.debug("Processing ARP packet from %s to %s", eth.src, eth.dst)
         arp_packet = packet.find('arp')
         
         if arp_packet:
-            log.debug(f"ARP packet details: opcode={arp_packet.opcode}, src_ip={arp_packet.protosrc}, dst_ip={arp_packet.protodst}")
+            log.debug("ARP packet details: opcode=%s, src_ip=%s, dst_ip=%s", arp_packet.opcode, arp_packet.protosrc, arp_packet.protodst)
             
             # Update IP to MAC mapping
-            if str(arp_packet.protosrc) not in ip_to_mac:
-                ip_to_mac[str(arp_packet.protosrc)] = src_mac
-                log.debug(f"Mapped IP {arp_packet.protosrc} to MAC {src_mac}")
+            arp_src_ip = arp_packet.protosrc.toUnsigned()
+            if arp_src_ip not in ip_to_mac:
+                ip_to_mac[arp_src_ip] = src_mac
+                log.debug("Mapped IP %s to MAC %s", arp_packet.protosrc, src_mac)
         
         # If we know the destination MAC location, send directly there
-        if str(eth.dst) in mac_to_port and not eth.dst.is_multicast and not eth.dst.is_broadcast:
-            dst_dpid, dst_port = mac_to_port[str(eth.dst)]
+        if dst_mac in mac_to_port and not eth.dst.is_multicast and not eth.dst.is_broadcast:
+            dst_dpid, dst_port = mac_to_port[dst_mac]
             if dst_dpid == dpid:  # If on same switch
                 msg = of.ofp_packet_out()
                 msg.data = event.ofp
-                msg.actions.append(of.ofp_action_output(port=dst_port))
+                msg.actions.append(output_action(dst_port))
                 msg.in_port = event.port
                 event.connection.send(msg)
-                log.info(f"Forwarding ARP directly to known host on port {dst_port}")
+                log.debug("Forwarding ARP directly to known host on port %s", dst_port)
                 return
         
         # Otherwise, flood ARP request/reply
@@ -318,45 +489,47 @@ def _handle_PacketIn(event):
     if not ip_packet:
         # Handle flooding for non-IP packets
         if eth.dst.is_multicast or eth.dst.is_broadcast:
-            log.debug(f"Flooding multicast/broadcast packet from switch {dpid}")
+            log.debug("Flooding multicast/broadcast packet from switch %s", dpid)
             flood_packet(event)
-        elif str(eth.dst) not in mac_to_port:
-            log.debug(f"Flooding packet with unknown destination MAC {eth.dst}")
+        elif dst_mac not in mac_to_port:
+            log.debug("Flooding packet with unknown destination MAC %s", eth.dst)
             flood_packet(event)
         return
 
-    src_ip = str(ip_packet.srcip)
-    dst_ip = str(ip_packet.dstip)
+    # IPv4 addresses are keyed by their 32-bit value; ints hash for free and
+    # are only formatted when a message is actually logged
+    src_ip = ip_packet.srcip.toUnsigned()
+    dst_ip = ip_packet.dstip.toUnsigned()
     
-    log.info(f"Processing IP packet: {src_ip} -> {dst_ip} on switch {dpid}")
+    log.debug("Processing IP packet: %s -> %s on switch %s", ip_packet.srcip, ip_packet.dstip, dpid)
 
     # Update IP to MAC mapping
     if src_ip not in ip_to_mac:
         ip_to_mac[src_ip] = src_mac
-        log.info(f"Mapped IP {src_ip} to MAC {src_mac}")
+        log.info("Mapped IP %s to MAC %s", ip_packet.srcip, src_mac)
 
     # Update host-to-switch mapping
     if src_ip not in host_to_switch:
         host_to_switch[src_ip] = dpid
-        log.info(f"Detected host {src_ip} connected to switch {dpid}")
+        log.info("Detected host %s connected to switch %s", ip_packet.srcip, dpid)
         
         # Create host name mapping based on IP
-        host_num = src_ip.split('.')[-1]
+        host_num = src_ip & 0xFF  # Last octet
         if src_ip not in ip_to_name:
             ip_to_name[src_ip] = f"h{host_num}"
-            log.info(f"Mapping {src_ip} to {ip_to_name[src_ip]}")
+            log.info("Mapping %s to %s", ip_packet.srcip, ip_to_name[src_ip])
 
     # If destination is broadcast/multicast, flood
     if ip_packet.dstip.is_multicast or ip_packet.dstip.is_broadcast:
-        log.debug(f"Flooding multicast/broadcast IP packet to {dst_ip}")
+        log.debug("Flooding multicast/broadcast IP packet to %s", ip_packet.dstip)
         flood_packet(event)
         return
 
     # If destination MAC is broadcast but we know the IP, try to use IP
     if (eth.dst.is_broadcast or eth.dst.is_multicast) and dst_ip in host_to_switch:
-        log.info(f"Broadcast MAC with known IP destination {dst_ip}, attempting to route based on IP")
-    elif str(eth.dst) not in mac_to_port and dst_ip not in host_to_switch:
-        log.warning(f"Unknown destination {dst_ip}, flooding packet")
+        log.debug("Broadcast MAC with known IP destination %s, attempting to route based on IP", ip_packet.dstip)
+    elif dst_mac not in mac_to_port and dst_ip not in host_to_switch:
+        log.warning("Unknown destination %s, flooding packet", ip_packet.dstip)
         flood_packet(event)
         return
 
@@ -365,49 +538,50 @@ def _handle_PacketIn(event):
     
     # If destination IP not in host_to_switch mapping, flood
     if dst_ip not in host_to_switch:
-        log.warning(f"Unknown destination IP {dst_ip}, flooding packet")
+        log.warning("Unknown destination IP %s, flooding packet", ip_packet.dstip)
         flood_packet(event)
         return
         
     dst_switch = host_to_switch[dst_ip]
-    log.info(f"Host-to-switch mapping: {src_ip} -> {src_switch}, {dst_ip} -> {dst_switch}")
+    log.debug("Host-to-switch mapping: %s -> %s, %s -> %s", ip_packet.srcip, src_switch, ip_packet.dstip, dst_switch)
 
-    # Compute shortest path if not already cached
-    path_key = (src_ip, dst_ip)
-    if path_key not in path_table:
+    # Compute shortest path if not already cached; paths depend only on the
+    # switches, so every host pair behind the same two switches shares one
+    route = path_table.get((src_switch, dst_switch))
+    if route is None:
         if src_switch == dst_switch:
-            path = [src_switch]  # Same switch, no need for Dijkstra
-            log.info(f"Source and destination on same switch: {src_switch}")
+            path = [src_switch]  # Same switch, no need for a path lookup
+            log.debug("Source and destination on same switch: %s", src_switch)
         else:
-            path = dijkstra(src_switch, dst_switch)
+            path = shortest_path(src_switch, dst_switch)
             
         if path:
-            path_table[path_key] = path
-            log.info(f"Computed path for {src_ip}->{dst_ip}: {path}")
+            route = cache_path(path)
+            log.debug("Computed path for %s->%s: %s", ip_packet.srcip, ip_packet.dstip, path)
         else:
-            log.warning(f"No path found from {src_ip} to {dst_ip}")
+            log.warning("No path found from %s to %s", ip_packet.srcip, ip_packet.dstip)
             flood_packet(event)  # Flood as fallback
             return
     else:
-        path = path_table[path_key]
-        log.info(f"Using cached path for {src_ip}->{dst_ip}: {path}")
+        log.debug("Using cached path for %s->%s: %s", ip_packet.srcip, ip_packet.dstip, route.path)
+    path = route.path
 
     # Get human-readable names for tracking
-    src_host = ip_to_name.get(src_ip, f"h{src_ip.split('.')[-1]}")
-    dst_host = ip_to_name.get(dst_ip, f"h{dst_ip.split('.')[-1]}")
+    src_host = ip_to_name.get(src_ip) or f"h{src_ip & 0xFF}"
+    dst_host = ip_to_name.get(dst_ip) or f"h{dst_ip & 0xFF}"
 
     # Check if this is an ICMP packet
     icmp_packet = packet.find('icmp')
     if icmp_packet:
-        log.info(f"Detected ICMP packet: type={icmp_packet.type}, code={icmp_packet.code}")
+        log.debug("Detected ICMP packet: type=%s, code=%s", icmp_packet.type, icmp_packet.code)
         
         # For ICMP Echo Request (ping), we want to track the path
         if icmp_packet.type == 8:  # Echo Request
-            log.info(f"Processing ICMP Echo Request from {src_ip} to {dst_ip}")
+            log.debug("Processing ICMP Echo Request from %s to %s", ip_packet.srcip, ip_packet.dstip)
             
             # Only send path data if the last command was a ping (not pingall)
-            if command_db.is_last_command_ping():
-                log.info("Last command was ping, sending path data")
+            if get_command_db().is_last_command_ping():
+                log.debug("Last command was ping, sending path data")
                 # Send path data for visualization
                 send_path_data(
                     "ping",
@@ -418,14 +592,14 @@ def _handle_PacketIn(event):
                     time.time() * 1000
                 )
             else:
-                log.info("Last command was not ping, skipping path data")
+                log.debug("Last command was not ping, skipping path data")
                 
         # For ICMP Echo Reply, we also want to track the path
         elif icmp_packet.type == 0:  # Echo Reply
-            log.info(f"Processing ICMP Echo Reply from {src_ip} to {dst_ip}")
+            log.debug("Processing ICMP Echo Reply from %s to %s", ip_packet.srcip, ip_packet.dstip)
             # Only send return path data if the last command was a ping
-            if command_db.is_last_command_ping():
-                log.info("Last command was ping, sending return path data")
+            if get_command_db().is_last_command_ping():
+                log.debug("Last command was ping, sending return path data")
                 send_path_data(
                     "pong",
                     src_host,
@@ -435,66 +609,70 @@ def _handle_PacketIn(event):
                     time.time() * 1000
                 )
             else:
-                log.info("Last command was not ping, skipping return path data")
+                log.debug("Last command was not ping, skipping return path data")
 
     # Check if the current switch is in the path
-    if dpid not in path:
-        log.warning(f"Current switch {dpid} not in path {path}, flooding packet")
+    if dpid not in route.positions:
+        log.warning("Current switch %s not in path %s, flooding packet", dpid, path)
         flood_packet(event)
         return
-        
-    # Find the position of the current switch in the path
-    current_pos = path.index(dpid)
-    
-    # Install flows and forward the packet
-    install_path_flows(event.connection, packet, path)
-    forward_packet(event, path, packet)
+
+    # Install flows and forward the packet, unless the flow install already did
+    dst_location = mac_to_port.get(dst_mac)
+    dst_port = dst_location[1] if dst_location and dst_location[0] == path[-1] else None
+    if not install_path_flows(event.connection, packet, route, event.ofp.buffer_id, dst_port):
+        forward_packet(event, route, packet)
 
 # Helper functions for packet handling
+def output_action(port):
+    """Return a shared output action for a port, creating it on first use."""
+    # Actions are only read when a message is packed, so one instance per port
+    # can be reused by every FlowMod and PacketOut
+    action = output_actions.get(port)
+    if action is None:
+        action = output_actions[port] = of.ofp_action_output(port=port)
+    return action
+
 def flood_packet(event):
     """Flood a packet out all ports except the input port."""
     msg = of.ofp_packet_out()
     msg.data = event.ofp
-    msg.actions.append(of.ofp_action_output(port=of.OFPP_FLOOD))
+    msg.actions.append(output_action(of.OFPP_FLOOD))
     msg.in_port = event.port
     event.connection.send(msg)
-    rate_limited_log(log, "debug", f"Flooding packet from switch {event.dpid}, port {event.port}", f"flood_{event.dpid}_{event.port}")
+    rate_limited_log(log, "debug", "Flooding packet from switch %s, port %s", ("flood", event.dpid, event.port),
+                     event.dpid, event.port)
 
-def forward_packet(event, path, packet):
-    """Forward a packet to the next switch in the path."""
+def forward_packet(event, route, packet):
+    """Forward a packet to the next switch in the route."""
     current_switch = event.dpid
-    current_pos = path.index(current_switch)
+    out_port = route.out_ports.get(current_switch)
     
     # If this is the last switch in the path, send to the host
-    if current_pos == len(path) - 1:
+    if out_port is None:
         # Find the destination MAC and its port
         if packet.dst in mac_to_port:
             _, dst_port = mac_to_port[packet.dst]
-            log.debug(f"Forwarding to destination host on switch {current_switch}, port {dst_port}")
+            log.debug("Forwarding to destination host on switch %s, port %s", current_switch, dst_port)
             msg = of.ofp_packet_out()
             msg.data = event.ofp
-            msg.actions.append(of.ofp_action_output(port=dst_port))
+            msg.actions.append(output_action(dst_port))
             msg.in_port = event.port
             event.connection.send(msg)
         else:
             # If we don't know the destination port, flood
-            log.warning(f"Unknown destination port for {packet.dst} on last switch {current_switch}, flooding")
+            log.warning("Unknown destination port for %s on last switch %s, flooding", packet.dst, current_switch)
             flood_packet(event)
         return
     
-    # Otherwise, forward to the next switch in the path
-    next_switch = path[current_pos + 1]
-    if next_switch in adjacency_list[current_switch]:
-        out_port = adjacency_list[current_switch][next_switch]
-        log.debug(f"Forwarding from switch {current_switch} to switch {next_switch} on port {out_port}")
-        msg = of.ofp_packet_out()
-        msg.data = event.ofp
-        msg.actions.append(of.ofp_action_output(port=out_port))
-        msg.in_port = event.port
-        event.connection.send(msg)
-    else:
-        log.warning(f"No adjacency information for switch {current_switch} to {next_switch}, flooding")
-        flood_packet(event)
+    # Otherwise, forward to the next switch in the path; the port was resolved
+    # when the route was cached, and link changes clear the cache
+    log.debug("Forwarding from switch %s towards switch %s on port %s", current_switch, route.path[-1], out_port)
+    msg = of.ofp_packet_out()
+    msg.data = event.ofp
+    msg.actions.append(output_action(out_port))
+    msg.in_port = event.port
+    event.connection.send(msg)
 
 def _handle_LinkEvent(event):
     """Handle link events to maintain topology information."""
@@ -514,12 +692,16 @@ def _handle_LinkEvent(event):
         if dst not in dpid_to_name:
             dpid_to_name[dst] = f"s{dst}"
         
-        # Clear path cache when topology changes
-        path_table.clear()
-        log.info("Path cache cleared due to topology change")
+        # Recompute next hops, then drop only the cached routes the new link
+        # affects: those over this link (its ports may have changed) and those
+        # it makes longer than the new shortest path
+        rebuild_next_hops()
+        dropped = invalidate_link(src, dst) + drop_longer_routes()
+        log.info(f"Dropped {dropped} cached paths due to topology change")
         
-        # Log the current adjacency list for debugging
-        log.info(f"Current adjacency list: {adjacency_list}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Adjacency list: %d switches, %d links", len(adjacency_list),
+                      sum(len(neighbors) for neighbors in adjacency_list.values()) // 2)
     elif event.removed:  # Link removed
         src, dst = link.dpid1, link.dpid2
         
@@ -531,29 +713,35 @@ def _handle_LinkEvent(event):
         
         log.info(f"Link removed: {src} <--> {dst}")
         
-        # Clear path cache when topology changes
-        path_table.clear()
-        log.info("Path cache cleared due to topology change")
+        # Only routes over the removed link are affected; removing a link
+        # never makes another route shorter
+        rebuild_next_hops()
+        dropped = invalidate_link(src, dst)
+        log.info(f"Dropped {dropped} cached paths due to topology change")
 
-        # Log the current adjacency list for debugging
-        log.info(f"Current adjacency list: {adjacency_list}")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Adjacency list: %d switches, %d links", len(adjacency_list),
+                      sum(len(neighbors) for neighbors in adjacency_list.values()) // 2)
 
 def get_command_id_from_packet(packet):
     """Extract command ID from packet data if present."""
     try:
-        # Check if packet has data payload
-        if hasattr(packet, 'payload') and packet.payload:
-            # Look for command ID in packet data
-            data = str(packet.payload)
-            if 'command_id:' in data:
-                # Extract command ID from packet data
-                command_id = data.split('command_id:')[1].split()[0]
+        # Scan the frame's raw bytes rather than formatting the parsed packet
+        raw = getattr(packet, 'raw', None)
+        if raw and b'command_id:' in raw:
+            match = COMMAND_ID_PATTERN.search(raw)
+            if match:
+                command_id = match.group(1).decode(errors='replace')
                 log.info(f"Found command ID in packet: {command_id}")
                 return command_id
     except Exception as e:
         log.warning(f"Error extracting command ID from packet: {e}")
     return None
 
+def _handle_GoingDown(event):
+    """Close pooled FastAPI connections when POX shuts down."""
+    http_session.close()
+
 def launch():
     """Initialize the controller components."""
     # Make sure the OpenFlow discovery component is running
@@ -567,10 +755,12 @@ def launch():
     core.openflow_discovery.addListenerByName("LinkEvent", _handle_LinkEvent)
     core.openflow.addListenerByName("ConnectionUp", _handle_ConnectionUp)
     core.openflow.addListenerByName("ConnectionDown", _handle_ConnectionDown)
+    core.addListenerByName("GoingDownEvent", _handle_GoingDown)
+
+    # Path data is posted to FastAPI from its own thread, off the recoco scheduler
+    threading.Thread(target=_path_data_worker, name="path-data", daemon=True).start()
     
-    # Add startup delay before trying to connect to FastAPI
-    from pox.lib.recoco import Timer
-    Timer(STARTUP_DELAY, check_fastapi_connection)
+    # The worker waits STARTUP_DELAY before its first connection check
     log.info(f"Will attempt to connect to FastAPI server in {STARTUP_DELAY} seconds...")
     
     log.info("SDN Controller with Path Tracking Started")
@@ -10,7 +10,7 @@ sudo lsof -t -i tcp:8000 | xargs kill -9
 # Start FastAPI server first
 echo "Starting FastAPI server..."
 cd server
-python3 -m uvicorn main:app --host 0.0.0.0 --port 8000 --reload &
+python3 -m uvicorn main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools --ws-per-message-deflate false --reload &
 FASTAPI_PID=$!
 
 # Wait for FastAPI server to start
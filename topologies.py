@@ -1,165 +1,150 @@
+import math
+from collections import deque
+from functools import lru_cache
+from itertools import combinations
 from mininet.topo import Topo
 
 
+class LinkBatchTopo(Topo):
+    """Topo that can add a batch of links in one call."""
+
+    def addLinks(self, links, **opts):
+        """Add a link for each (node1, node2) pair in order, all with the same options.
+
+        Does what Topo.addLink does per link, with the port allocator, the
+        graph insert and the shared options looked up once for the batch.
+        """
+        if not opts and self.lopts:
+            opts = self.lopts
+        add_port = self.addPort
+        add_edge = self.g.add_edge
+        for node1, node2 in links:
+            port1, port2 = add_port(node1, node2)
+            link_opts = dict(opts, node1=node1, node2=node2, port1=port1, port2=port2)
+            add_edge(node1, node2, None, link_opts)
+
+
 # Custom topology classes
-class CustomTopo(Topo):
+class CustomTopo(LinkBatchTopo):
     def build(self, num_switches=1, num_hosts=1):
         if num_switches > 20 or num_hosts > 100:
             raise ValueError("Exceeds max allowed: 20 switches, 100 hosts.")
 
-        switches = []
-        for i in range(num_switches):
-            switch = self.addSwitch(f"s{i+1}")
-            switches.append(switch)
+        switches = [self.addSwitch(f"s{i+1}") for i in range(num_switches)]
+        hosts = [self.addHost(f"h{i+1}") for i in range(num_hosts)]
 
-        for i in range(num_hosts):
-            host = self.addHost(f"h{i+1}")
-            switch_index = i % num_switches
-            self.addLink(host, switches[switch_index])
+        # Spread the hosts over the switches, then chain the switches
+        self.addLinks((host, switches[i % num_switches]) for i, host in enumerate(hosts))
+        self.addLinks(zip(switches, switches[1:]))
 
-        for i in range(num_switches - 1):
-            self.addLink(switches[i], switches[i + 1])
 
 
-
-class RingTopo(Topo):
+class RingTopo(LinkBatchTopo):
     def __init__(self, num_hosts):
         super().__init__()
         # Create switches
         switches = [self.addSwitch(f"s{i+1}") for i in range(num_hosts)]
         
         # Create hosts and connect each to its switch
-        for i in range(num_hosts):
-            host = self.addHost(f"h{i+1}")
-            self.addLink(host, switches[i])
+        hosts = [self.addHost(f"h{i+1}") for i in range(num_hosts)]
+        self.addLinks(zip(hosts, switches))
         
-        # Connect switches in a ring
-        for i in range(num_hosts):
-            self.addLink(switches[i], switches[(i+1) % num_hosts])
+        # Connect switches in a chain, then close the ring
+        self.addLinks(zip(switches, switches[1:]))
+        if num_hosts > 1:
+            self.addLink(switches[-1], switches[0])
 
 
-class FullMeshTopo(Topo):
+class FullMeshTopo(LinkBatchTopo):
     def __init__(self, num_hosts):
         super(FullMeshTopo, self).__init__()
         # Create hosts
-        hosts = []
-        for i in range(num_hosts):
-            host = self.addHost(f"h{i+1}")
-            hosts.append(host)
+        hosts = [self.addHost(f"h{i+1}") for i in range(num_hosts)]
 
         # Fully connect all hosts (Mesh topology)
-        for i in range(num_hosts):
-            for j in range(i + 1, num_hosts):
-                self.addLink(hosts[i], hosts[j])
-
-class Partial_MeshTopo(Topo):
-    def __init__(self, num_hosts):
-        super(Partial_MeshTopo, self).__init__()
-
-        # Create hosts
-        hosts = []
-        for i in range(num_hosts):
-            host = self.addHost(f"h{i+1}")
-            hosts.append(host)
-
-        # Create partial mesh connections
-        for i in range(num_hosts):
-            if i < num_hosts - 1:
-                self.addLink(hosts[i], hosts[i+1])  # Connect each host to the next
-                
-            if i < num_hosts - 2:
-                self.addLink(hosts[i], hosts[i+2])  # Skipping one for partial connectivity
+        self.addLinks(combinations(hosts, 2))
 
-        # Optionally, connect the last host back to the first for a looped structure
-        if num_hosts > 2:
-            self.addLink(hosts[num_hosts-1], hosts[0])
-
-class StarTopo(Topo):
+class StarTopo(LinkBatchTopo):
     def __init__(self, num_hosts):
         super(StarTopo, self).__init__()
 
         switch = self.addSwitch("s1")  # Add a central switch
 
         # Create hosts and connect them to the switch
-        for i in range(num_hosts):
-            host = self.addHost(f"h{i+1}")
-            self.addLink(host, switch)
+        hosts = [self.addHost(f"h{i+1}") for i in range(num_hosts)]
+        self.addLinks((host, switch) for host in hosts)
 
-class PartialMeshTopo(Topo):
+class PartialMeshTopo(LinkBatchTopo):
     def __init__(self, num_hosts):
         super().__init__()
         switch = self.addSwitch('s1')
         # Create hosts and connect them in a partial mesh
-        hosts = []
-        for i in range(1, num_hosts + 1):
-            host = self.addHost(f"h{i}")
-            hosts.append(host)
-            self.addLink(host, switch)  # Connect each host to the switch
-
-        # Add additional host-to-host links for partial mesh
-        for i in range(len(hosts)):
-            if i < len(hosts) - 1:
-                self.addLink(hosts[i], hosts[i + 1])  # Connect adjacent hosts
-            if i < len(hosts) - 2:
-                self.addLink(hosts[i], hosts[i + 2])  # Connect skipping one
-
-class FatTree(Topo):
+        hosts = [self.addHost(f"h{i}") for i in range(1, num_hosts + 1)]
+        self.addLinks((host, switch) for host in hosts)  # Connect each host to the switch
+
+        # Add additional host-to-host links for partial mesh: each host to the
+        # next one and to the one after that
+        self.addLinks(
+            (hosts[i], hosts[j])
+            for i in range(len(hosts))
+            for j in (i + 1, i + 2)
+            if j < len(hosts)
+        )
+
+@lru_cache(maxsize=16)
+def fat_tree_k(num_hosts):
+    """Return the smallest even k whose fat tree has k**3 / 4 >= num_hosts host slots."""
+    # Start from the cube root of 4 * num_hosts rounded up to even, then
+    # correct for float rounding in either direction; counts of zero or
+    # less get the smallest tree, as the old search loop gave them
+    k = max(2, 2 * math.ceil((4 * max(num_hosts, 0)) ** (1 / 3) / 2))
+    while k > 2 and (k - 2) ** 3 // 4 >= num_hosts:
+        k -= 2
+    while k ** 3 // 4 < num_hosts:
+        k += 2
+    return k
+
+
+class FatTree(LinkBatchTopo):
     def __init__(self, num_hosts):
         super(FatTree, self).__init__()
 
         # Determine k value based on the number of hosts
-        k = 2
-        while (k // 2) * (k // 2) * k < num_hosts:
-            k += 2
-
-        pod = k
+        pod = fat_tree_k(num_hosts)
         num_core = (pod // 2) ** 2
         num_agg = pod * pod // 2
         num_edge = num_agg
 
-        # Creating switches
-        core_switches = []
-        agg_switches = []
-        edge_switches = []
-
-        # Add Core Switches
-        for i in range(num_core):
-            sw = self.addSwitch(f's{i+1}')
-            core_switches.append(sw)
-
-        # Add Aggregation Switches
-        for i in range(num_agg):
-            sw = self.addSwitch(f's{num_core + i + 1}')
-            agg_switches.append(sw)
-
-        # Add Edge Switches
-        for i in range(num_edge):
-            sw = self.addSwitch(f's{num_core + num_agg + i + 1}')
-            edge_switches.append(sw)
+        # Creating switches, numbered core first, then aggregation, then edge
+        add_switch = self.addSwitch
+        switch_names = map('s{}'.format, range(1, num_core + num_agg + num_edge + 1))
+        switches = [add_switch(name) for name in switch_names]
+        core_switches = switches[:num_core]
+        agg_switches = switches[num_core:num_core + num_agg]
+        edge_switches = switches[num_core + num_agg:]
 
         # Creating links between switches
-        # Core to Aggregation Layer
-        for i in range(num_core):
-            core_sw = core_switches[i]
-            start = i % (pod // 2)
-            for j in range(pod):
-                self.addLink(core_sw, agg_switches[start + j * (pod // 2)], bw=10)
-
-        # Aggregation to Edge Layer
-        for i in range(num_agg):
-            group = i // (pod // 2)
-            for j in range(pod // 2):
-                self.addLink(agg_switches[i], edge_switches[group * (pod // 2) + j], bw=10)
-
-        # Creating hosts and linking to edge switches
-        host_count = 0
-        for i in range(num_edge):
-            for j in range(2):
-                host_count += 1
-                if host_count > num_hosts:
-                    return
-                host = self.addHost(f'h{host_count}', bw=10)
-                self.addLink(edge_switches[i], host)
+        half = pod // 2
+        # Core i links to aggregation switch i % half of every pod
+        core_agg_links = [
+            (core_sw, agg_switches[i % half + j * half])
+            for i, core_sw in enumerate(core_switches)
+            for j in range(pod)
+        ]
+        # Each aggregation switch links to every edge switch of its pod
+        agg_edge_links = [
+            (agg_sw, edge_sw)
+            for group in range(0, num_agg, half)
+            for agg_sw in agg_switches[group:group + half]
+            for edge_sw in edge_switches[group:group + half]
+        ]
+        self.addLinks(core_agg_links + agg_edge_links, bw=10)
+
+        # Creating hosts and linking two to each edge switch in turn
+        add_host = self.addHost
+        host_names = map('h{}'.format, range(1, min(num_hosts, 2 * num_edge) + 1))
+        hosts = [add_host(name, bw=10) for name in host_names]
+        self.addLinks((edge_switches[i // 2], host) for i, host in enumerate(hosts))
 
 
 class TreeTopo(Topo):
@@ -171,22 +156,18 @@ class TreeTopo(Topo):
 
         # Create root switch
         root_switch = self.addSwitch("s1")
-        switches = [root_switch]
-        hosts = []
         host_index = 1
         switch_index = 2  # Start from s2
-        queue = [root_switch]
+        queue = deque([root_switch])
 
         while host_index <= num_hosts:
-            parent_switch = queue.pop(0)
+            parent_switch = queue.popleft()
 
             # Attach exactly 2 hosts to the current switch if possible
             host_count = min(2, num_hosts - host_index + 1)
             for _ in range(host_count):
                 host = self.addHost(f"h{host_index}")
                 self.addLink(parent_switch, host)
-                
-                hosts.append(host)
                 host_index += 1
 
             # Only add child switches if there are hosts left
@@ -200,7 +181,6 @@ class TreeTopo(Topo):
                     left_switch = self.addSwitch(f"s{switch_index}")
                     self.addLink(parent_switch, left_switch)
                     queue.append(left_switch)
-                    switches.append(left_switch)
                     switch_index += 1
 
             # Check if we need to add a right child switch
@@ -213,17 +193,17 @@ class TreeTopo(Topo):
                     right_switch = self.addSwitch(f"s{switch_index}")
                     self.addLink(parent_switch, right_switch)
                     queue.append(right_switch)
-                    switches.append(right_switch)
                     switch_index += 1
 
-        # Create JSON response
-        topology_data = {
-            "message": "Tree topology generated successfully!",
-            "topology": {
-                "hosts": [str(h) for h in hosts],
-                "switches": [str(s) for s in switches],
-                "links": [(str(link[0]), str(link[1])) for link in self.links()]
-            },
-            "status": "success"
-        }
 
+# Topology name -> class, in the form Mininet loads from --custom files
+# (e.g. "sudo mn --custom topologies.py --topo ring,4")
+topos = {
+    "custom": CustomTopo,
+    "ring": RingTopo,
+    "mesh": FullMeshTopo,
+    "partialmesh": PartialMeshTopo,
+    "star": StarTopo,
+    "fattree": FatTree,
+    "tree": TreeTopo,
+}
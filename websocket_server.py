@@ -1,6 +1,7 @@
 import asyncio
+import sys
 import websockets
-import json
+import orjson
 import logging
 from typing import Dict, Set, Any
 
@@ -8,20 +9,38 @@ from typing import Dict, Set, Any
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("WebSocketServer")
 
+# Client types, interned so dict lookups on them compare by identity
+FLUTTER = sys.intern("flutter")
+SERVER = sys.intern("server")
+
 class WebSocketServer:
+    # Request path -> client type
+    CLIENT_TYPES_BY_PATH = {
+        "/ws/flutter": FLUTTER,
+        "/ws/server": SERVER,
+    }
+    # Client type -> the client type its messages are routed to
+    PEER_TYPES = {
+        FLUTTER: SERVER,
+        SERVER: FLUTTER,
+    }
+
     def __init__(self):
         self.clients: Dict[str, Set[websockets.WebSocketServerProtocol]] = {
-            "flutter": set(),
-            "server": set()
+            FLUTTER: set(),
+            SERVER: set()
         }
 
     def print_connections(self):
-        """Print current connection status."""
-        logger.info("Current WebSocket Connections:")
+        """Log current connection status at DEBUG level."""
+        # Walks every connection, so skip it entirely unless DEBUG is enabled
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        logger.debug("Current WebSocket Connections:")
         for client_type, clients in self.clients.items():
-            logger.info(f"{client_type} clients: {len(clients)}")
+            logger.debug("%s clients: %d", client_type, len(clients))
             for client in clients:
-                logger.info(f"  - {client.remote_address}")
+                logger.debug("  - %s", client.remote_address)
 
     async def register_client(self, websocket, client_type: str):
         """Register a new client connection."""
@@ -35,49 +54,38 @@ class WebSocketServer:
         logger.info(f"{client_type} client disconnected. Remaining {client_type} clients: {len(self.clients[client_type])}")
         self.print_connections()
 
-    async def _send_message(self, websocket, message: Dict[str, Any]):
-        """Send a message to a specific client."""
-        try:
-            await websocket.send(json.dumps(message))
-        except websockets.exceptions.ConnectionClosed:
-            logger.warning("Connection closed while sending message")
-
     async def broadcast_to_type(self, message: Dict[str, Any], client_type: str):
         """Broadcast a message to all clients of a specific type."""
         if client_type not in self.clients:
             logger.error(f"Unknown client type: {client_type}")
             return
 
-        disconnected = set()
-        for client in self.clients[client_type]:
-            try:
-                await self._send_message(client, message)
-            except websockets.exceptions.ConnectionClosed:
-                disconnected.add(client)
-
-        # Remove disconnected clients
-        for client in disconnected:
-            self.clients[client_type].discard(client)
+        # Serialize once; decoded so clients keep receiving text frames rather
+        # than binary ones. broadcast() writes to every open connection without
+        # waiting on any of them and skips connections that are closed, which
+        # handle_client unregisters when their receive loop ends
+        payload = orjson.dumps(message).decode()
+        websockets.broadcast(self.clients[client_type], payload)
 
     async def handle_client(self, websocket, path: str):
         """Handle a new client connection."""
         try:
-            # Extract client type from path (e.g., /ws/flutter or /ws/server)
-            client_type = path.split('/')[-1]
-            if client_type not in self.clients:
-                logger.error(f"Invalid client type: {client_type}")
+            # Look up client type from path (/ws/flutter or /ws/server)
+            client_type = self.CLIENT_TYPES_BY_PATH.get(path)
+            if client_type is None:
+                logger.error(f"Invalid client path: {path}")
                 return
 
             await self.register_client(websocket, client_type)
+            # Messages are routed to the other client type
+            target_type = self.PEER_TYPES[client_type]
 
             try:
                 async for message in websocket:
                     try:
-                        data = json.loads(message)
-                        # Route message to the other client type
-                        target_type = "server" if client_type == "flutter" else "flutter"
+                        data = orjson.loads(message)
                         await self.broadcast_to_type(data, target_type)
-                    except json.JSONDecodeError:
+                    except orjson.JSONDecodeError:
                         logger.error(f"Invalid JSON received from {client_type} client")
             except websockets.exceptions.ConnectionClosed:
                 logger.info(f"{client_type} client connection closed normally")